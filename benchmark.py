@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of NaiveUniverse and HashLifeUniverse on canonical patterns.
+
+Every case runs in a fresh process, so that its peak RSS is its own.
+HashLifeUniverse runs twice: once to time it, with the forward() and
+extend time split, and once more under hashlife.profile() for the number
+of nodes created and the memo hit rate, so that the counters do not
+weigh on the timings.
+
+    python benchmark.py                           # every case
+    python benchmark.py --case acorn --case gun   # some of them
+    python benchmark.py --pattern breeder.rle --generations 4096
+    python benchmark.py --rule B36/S23            # HighLife
+    python benchmark.py --json base.json          # save the results
+    python benchmark.py --compare base.json       # ratios to a saved run
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import hashlife
+
+PATTERNS = {
+    'gun': '''x = 36, y = 9
+24bo$22bobo$12b2o6b2o12b2o$11bo3bo4b2o12b2o$2o8bo5bo3b2o$2o8bo3bob2o4bo
+bo$10bo5bo7bo$11bo3bo$12b2o!''',
+    'r-pentomino': '''x = 3, y = 3
+b2o$2o$bo!''',
+    'acorn': '''x = 7, y = 3
+bo$3bo$2o2b3o!''',
+    # the smallest pattern growing forever: a switch engine laying blocks
+    'switch-engine': '''x = 8, y = 6
+6bo$4bob2o$4bobo$4bo$2bo$obo!''',
+    # a spacefiller, growing quadratically like a breeder: Max
+    'max': '''x = 27, y = 27
+18bo8b$17b3o7b$12b3o4b2o6b$11bo2b3o2bob2o4b$10bo3bobo2bobo5b$10bo4bobo
+bobob2o2b$12bo4bobo3b2o2b$4o5bobo4bo3bob3o2b$o3b2obob3ob2o9b2ob$o5b2o5b
+o13b$bo2b2obo2bo2bob2o10b$7bobobobobobo5b4o$bo2b2obo2bo2bo2b2obob2o3bo$
+o5b2o3bobobo3b2o5bo$o3b2obob2o2bo2bo2bob2o2bob$4o5bobobobobobo7b$10b2ob
+o2bo2bob2o2bob$13bo5b2o5bo$b2o9b2ob3obob2o3bo$2b3obo3bo4bobo5b4o$2b2o3b
+obo4bo12b$2b2obobobobo4bo10b$5bobo2bobo3bo10b$4b2obo2b3o2bo11b$6b2o4b3o
+12b$7b3o17b$8bo!''',
+}
+
+# name: (pattern, density, hashlife generations, naive generations)
+CASES = {
+    'gun':              ('gun',           None, 1 << 14, 256),
+    'r-pentomino':      ('r-pentomino',   None, 1 << 12, 256),
+    'acorn':            ('acorn',         None, 1 << 13, 256),
+    'switch-engine':    ('switch-engine', None, 1 << 16, 256),
+    'max':              ('max',           None, 1 << 16, 256),
+    'soup-64-0.1':      (64,              0.1,  1 << 12, 256),
+    'soup-64-0.3':      (64,              0.3,  1 << 12, 256),
+    'soup-64-0.5':      (64,              0.5,  1 << 12, 256),
+    'soup-256-0.3':     (256,             0.3,  1 << 10, 256),
+}
+
+ENGINES = ('naive', 'hashlife')
+
+STORES = {
+    'node':  hashlife.NodeStore,
+    'table': hashlife.TableStore,
+}
+
+
+class TimedUniverse(hashlife.HashLifeUniverse):
+    """HashLifeUniverse adding up the time spent growing the root before
+    each step and the time spent in forward()"""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.forward_time = 0.
+        self.extend_time = 0.
+
+    def _prepare(self, l):
+        start = time.perf_counter()
+        super()._prepare(l)
+        self.extend_time += time.perf_counter() - start
+
+    def _forward(self, l, check = None):
+        start = time.perf_counter()
+        result = super()._forward(l, check)
+        self.forward_time += time.perf_counter() - start
+        return result
+
+
+def cells_of(spec, density, seed):
+    """Returns the cells of a case as (n, m, rows of booleans)"""
+    if density is not None:
+        rnd = random.Random(seed)
+        return spec, spec, [[rnd.random() < density for _ in range(spec)] for _ in range(spec)]
+
+    if spec in PATTERNS:
+        lines = PATTERNS[spec].splitlines()
+    else:
+        with open(spec) as file:
+            lines = file.read().splitlines()
+    n = m = 0
+    live = []
+    for index, line in enumerate(lines):
+        if line.startswith('x'):
+            header = hashlife.rle_header(line)
+            n, m = header.get('y', 0), header.get('x', 0)
+            live = list(hashlife.read_rle(lines[index + 1:]))
+            break
+    n = max([n] + [i + 1 for i, _ in live])
+    m = max([m] + [j + 1 for _, j in live])
+    rows = [[False] * m for _ in range(n)]
+    for i, j in live:
+        rows[i][j] = True
+    return n, m, rows
+
+
+def peak_rss():
+    """Returns the peak resident set size of the process in KiB, or None"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB elsewhere
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def padded(n, m, rows, generations):
+    """Returns the size and rows of the grid holding rows with a margin of
+    one cell per generation, which keeps the pattern off the border of a
+    NaiveUniverse, and the width of the margin"""
+    pad = generations + 1
+    grid = [[False] * (m + 2 * pad) for _ in range(pad)]
+    grid += [[False] * pad + list(row) + [False] * pad for row in rows]
+    grid += [[False] * (m + 2 * pad) for _ in range(pad)]
+    return n + 2 * pad, m + 2 * pad, grid, pad
+
+
+def environment():
+    """Returns what the timings of a run depend on, saved along them"""
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'numpy': hashlife.np is not None,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def load_baseline(path, field):
+    """Returns the entries of a run saved by --json, or None without path"""
+    if path is None:
+        return None
+    with open(path) as file:
+        return json.load(file)[field]
+
+
+def run_naive(n, m, rows, generations, rule):
+    n, m, grid, _ = padded(n, m, rows, generations)
+    universe = hashlife.NaiveUniverse(n, m, grid, rule = rule)
+
+    start = time.perf_counter()
+    for _ in range(generations):
+        universe.round()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'seconds': elapsed,
+        'population': universe.population,
+        'cells': universe.n * universe.m,
+    }
+
+
+def run_hashlife(n, m, rows, generations, store, mode, step, rule):
+    result = {}
+    for counting in (False, True):
+        with hashlife.use_store(STORES[store](rule = rule)) as nodes:
+            start = time.perf_counter()
+            universe = TimedUniverse(n, m, rows)
+            loaded = time.perf_counter()
+            universe.set_schedule(mode, step)
+            if counting:
+                with hashlife.profile(universe) as stats:
+                    universe.rounds(generations)
+            else:
+                universe.rounds(generations)
+            elapsed = time.perf_counter() - loaded
+
+            if counting:
+                result.update({
+                    'nodes_created': sum(stats.canon_misses.values()),
+                    'memo_hits': sum(stats.memo_hits.values()),
+                    'memo_misses': sum(stats.memo_misses.values()),
+                    'memo_hit_rate': stats.hit_rate(),
+                    'base_cases': sum(stats.base_cases.values()),
+                    'stats': stats.as_dict(),
+                })
+            else:
+                result.update({
+                    'seconds': elapsed,
+                    'load_seconds': loaded - start,
+                    'forward_seconds': universe.forward_time,
+                    'extend_seconds': universe.extend_time,
+                    'population': universe.population,
+                    'level': universe.root.level,
+                    'node_count': nodes.node_count,
+                    'memo_count': nodes.memo_count,
+                    'nbytes': nodes.nbytes,
+                    'peak_rss_kb': peak_rss(),
+                })
+    return result
+
+
+def run_case(task):
+    """Runs one (case, engine) task in this process"""
+    n, m, rows = cells_of(task['pattern'], task['density'], task['seed'])
+    generations = task['generations']
+    if task['engine'] == 'naive':
+        result = run_naive(n, m, rows, generations, task['rule'])
+        result['peak_rss_kb'] = peak_rss()
+    else:
+        result = run_hashlife(n, m, rows, generations, task['store'], task['mode'], task['step'], task['rule'])
+    result.update(task)
+    result['gens_per_second'] = generations / result['seconds'] if result['seconds'] else None
+    return result
+
+
+def spawn(task):
+    """Runs one task in a fresh interpreter and returns its result"""
+    process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--task', json.dumps(task)],
+        stdout = subprocess.PIPE, check = True, universal_newlines = True)
+    return json.loads(process.stdout)
+
+
+def tasks_of(args):
+    cases = dict(CASES)
+    if args.pattern:
+        for path in args.pattern:
+            cases[os.path.basename(path)] = (path, None, 1 << 12, 256)
+    names = args.case or list(cases)
+    for name in names:
+        if name not in cases:
+            raise SystemExit("unknown case %r, pick among %s" % (name, ', '.join(cases)))
+
+    for name in names:
+        pattern, density, generations, naive = cases[name]
+        for engine in args.engine or ENGINES:
+            count = generations if engine == 'hashlife' else naive
+            if args.generations is not None:
+                count = args.generations
+            if engine == 'naive' and args.skip_naive:
+                continue
+            yield {
+                'case': name,
+                'engine': engine,
+                'pattern': pattern,
+                'density': density,
+                'seed': args.seed,
+                'generations': count,
+                'store': args.store,
+                'mode': args.mode,
+                'step': args.step,
+                'rule': args.rule,
+            }
+
+
+def key_of(result):
+    return (result['case'], result['engine'], result['store'], result.get('rule', 'B3/S23'))
+
+
+def report(results, baseline = None):
+    """Prints one line per result, with the speedup to the baseline"""
+    previous = {key_of(result): result for result in baseline or ()}
+    columns = '%-16s %-8s %10s %12s %10s %9s %9s %10s %8s'
+    print(columns % ('case', 'engine', 'gens', 'gens/s', 'forward', 'extend', 'hit rate', 'rss (KiB)', 'vs base'))
+    for result in results:
+        old = previous.get(key_of(result))
+        ratio = ''
+        if old and old['gens_per_second'] and result['gens_per_second']:
+            ratio = '%.2fx' % (result['gens_per_second'] / old['gens_per_second'])
+        rate = result.get('memo_hit_rate')
+        print(columns % (
+            result['case'], result['engine'], result['generations'],
+            '%.1f' % result['gens_per_second'],
+            '%.3fs' % result['forward_seconds'] if 'forward_seconds' in result else '',
+            '%.3fs' % result['extend_seconds'] if 'extend_seconds' in result else '',
+            '%.1f%%' % (100 * rate) if rate is not None else '',
+            result['peak_rss_kb'] if result['peak_rss_kb'] is not None else '',
+            ratio))
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__.strip().splitlines()[0])
+    parser.add_argument('--case', action = 'append', help = 'case to run, repeatable (default: all)')
+    parser.add_argument('--engine', action = 'append', choices = ENGINES, help = 'engine to run, repeatable (default: both)')
+    parser.add_argument('--pattern', action = 'append', help = 'extra case from an RLE file, repeatable')
+    parser.add_argument('--generations', type = int, help = 'generations of every case')
+    parser.add_argument('--skip-naive', action = 'store_true', help = 'only run HashLifeUniverse')
+    parser.add_argument('--store', choices = sorted(STORES), default = 'node')
+    parser.add_argument('--mode', choices = ('jump', 'fixed'), default = 'jump')
+    parser.add_argument('--step', type = int)
+    parser.add_argument('--rule', default = 'B3/S23', help = 'rule in B/S notation (default: Life)')
+    parser.add_argument('--seed', type = int, default = 0, help = 'seed of the random soups')
+    parser.add_argument('--json', help = 'file to save the results to')
+    parser.add_argument('--compare', help = 'results saved by --json to compare with')
+    parser.add_argument('--task', help = argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.task:
+        json.dump(run_case(json.loads(args.task)), sys.stdout)
+        return
+
+    results = []
+    for task in tasks_of(args):
+        results.append(spawn(task))
+        print('%s/%s done' % (task['case'], task['engine']), file = sys.stderr)
+
+    report(results, load_baseline(args.compare, 'results'))
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(dict(environment(), results = results), file, indent = 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,557 @@
+# -*- coding: utf-8 -*-
+"""
+Differential fuzzing of HashLifeUniverse against NaiveUniverse.
+
+Each case is a random soup, rule, schedule, root size and number of
+generations, run in pieces. Some cases instead crowd the edge of a square
+of side 2**l, lines along it or dense rows next to it, stepped 2**l
+generations at a time: the square is then the central quarter of the
+level l+2 nodes the step is computed from, where patterns growing at c
+leave it soonest. HashLifeUniverse steps it in a store shared
+with the previous cases of its kind, so that memoized results, eviction
+and collection are exercised across patterns, and NaiveUniverse steps it
+on a grid with a margin no pattern can reach. The live cells, the
+population and get() on the live cells and on random dead ones must
+agree. The APIs built on top of stepping, cycles, batches, tiles,
+serialization round trips and cell edits, are then checked on the case
+as well, against rounds() and get(), and a few patterns of known
+behavior are checked once before the cases. A failing case is shrunk to
+fewer generations and cells and printed as JSON, ready for --replay.
+
+The time of both engines is added up per store, mode and rule, and with
+--compare the HashLifeUniverse times are checked against a run saved by
+--json with the same seed and cases.
+
+    python fuzz.py                              # 100 cases
+    python fuzz.py --cases 2000 --seed 7
+    python fuzz.py --store table --mode fixed --max-bytes 200000
+    python fuzz.py --rule B3/S23 --rule B2/S --random-rules
+    python fuzz.py --json base.json             # save the timings
+    python fuzz.py --compare base.json          # flag slowdowns
+    python fuzz.py --replay failure.json        # rerun a printed case
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import traceback
+
+import hashlife
+from benchmark import STORES, environment, load_baseline, padded
+
+MODES = ('jump', 'fixed')
+
+RULES = ('B3/S23', 'B36/S23', 'B2/S')
+
+DENSITIES = (0.05, 0.2, 0.35, 0.5, 0.8)
+
+
+def random_rule(rnd):
+    """Returns a random rule without B0, in B/S notation"""
+    birth = [k for k in range(1, 9) if rnd.random() < 0.3] or [3]
+    survival = [k for k in range(9) if rnd.random() < 0.3]
+    return 'B%s/S%s' % (''.join(map(str, birth)), ''.join(map(str, survival)))
+
+
+def edge_cells(rnd, side):
+    """Returns the live cells of a side x side square crowding its border:
+    full lines along some of its edges, or dense rows and columns next
+    to them"""
+    live = set()
+    if rnd.random() < 0.5:
+        for edge in rnd.sample(range(4), rnd.randint(1, 4)):
+            for x in range(side):
+                live.add(((0, x), (side - 1, x), (x, 0), (x, side - 1))[edge])
+    else:
+        depth = rnd.randint(1, max(1, side // 4))
+        for i in range(side):
+            for j in range(side):
+                if min(i, j, side - 1 - i, side - 1 - j) < depth and rnd.random() < 0.8:
+                    live.add((i, j))
+    return sorted(live)
+
+
+def case_of(rnd, args):
+    """Returns a random case as a dict, which JSON round-trips"""
+    mode = rnd.choice(args.mode or MODES)
+    rules = list(args.rule or RULES)
+    if args.random_rules:
+        rules.append(random_rule(rnd))
+    case = {
+        'rule': rnd.choice(rules),
+        'store': rnd.choice(args.store or sorted(STORES)),
+        'mode': mode,
+    }
+
+    if rnd.random() < args.edges:
+        # a square filling the central quarter of the level l+2 nodes of a
+        # step of 2**l, crowded at its edge
+        l = rnd.randint(1, min(5, max(1, args.max_generations.bit_length() - 1)))
+        pieces = [1 << l] * rnd.randint(1, 3)
+        while len(pieces) > 1 and sum(pieces) > args.max_generations:
+            pieces.pop()
+        case.update({
+            'n': 1 << l,
+            'm': 1 << l,
+            'live': [list(cell) for cell in edge_cells(rnd, 1 << l)],
+            'step': l if mode == 'fixed' else None,
+            'extend': 0,
+            'pieces': pieces,
+        })
+        return case
+
+    n = rnd.randint(1, args.max_size)
+    m = rnd.randint(1, args.max_size)
+    density = rnd.choice(DENSITIES)
+    # generations in pieces, to step from roots left by previous rounds()
+    pieces = [rnd.randint(0, args.max_generations) for _ in range(rnd.randint(1, 3))]
+    while sum(pieces) > args.max_generations:
+        pieces[pieces.index(max(pieces))] //= 2
+    case.update({
+        'n': n,
+        'm': m,
+        'live': [[i, j] for i in range(n) for j in range(m) if rnd.random() < density],
+        'step': rnd.randint(0, 5) if mode == 'fixed' else None,
+        # level the root is grown to before stepping, if any
+        'extend': rnd.choice((0, 0, rnd.randint(1, 8))),
+        'pieces': pieces,
+    })
+    return case
+
+
+def rows_of(case):
+    rows = [[False] * case['m'] for _ in range(case['n'])]
+    for i, j in case['live']:
+        rows[i][j] = True
+    return rows
+
+
+def run_naive(case):
+    """Returns the live cells of the case after its generations, in the
+    coordinates of HashLifeUniverse, and the time it took"""
+    n, m = case['n'], case['m']
+    height, width, grid, pad = padded(n, m, rows_of(case), sum(case['pieces']))
+    universe = hashlife.NaiveUniverse(height, width, grid, rule = case['rule'])
+
+    start = time.perf_counter()
+    for _ in range(sum(case['pieces'])):
+        universe.round()
+    elapsed = time.perf_counter() - start
+
+    # load() puts the cell (i, j) of the n x m matrix at (i - n//2, j - m//2)
+    di, dj = pad + n // 2, pad + m // 2
+    cells = universe.cells
+    live = set(
+        (i - di, j - dj)
+        for i in range(universe.n) for j in range(universe.m) if cells[i][j])
+    return live, elapsed
+
+
+def run_hashlife(case, store):
+    """Returns the universe after the generations of the case, stepped in
+    store, and the time it took"""
+    with hashlife.use_store(store):
+        start = time.perf_counter()
+        universe = hashlife.HashLifeUniverse(case['n'], case['m'], rows_of(case))
+        if case['extend']:
+            universe.extend(case['extend'])
+        universe.set_schedule(case['mode'], case['step'])
+        for generations in case['pieces']:
+            universe.rounds(generations)
+        elapsed = time.perf_counter() - start
+    return universe, elapsed
+
+
+def differences(case, universe, live, rnd):
+    """Returns what tells universe from the reference live cells, as a list
+    of messages"""
+    problems = []
+    if universe.generation != sum(case['pieces']):
+        problems.append('generation %d instead of %d' % (universe.generation, sum(case['pieces'])))
+    if universe.population != len(live):
+        problems.append('population %d instead of %d' % (universe.population, len(live)))
+    cells = set(universe.live_cells())
+    for cell in sorted(cells - live)[:8]:
+        problems.append('cell %s is alive, it should be dead' % (cell,))
+    for cell in sorted(live - cells)[:8]:
+        problems.append('cell %s is dead, it should be alive' % (cell,))
+
+    # get() on the live cells and on dead cells around them
+    probes = list(live)
+    if live:
+        low_i = min(i for i, _ in live) - 4
+        high_i = max(i for i, _ in live) + 4
+        low_j = min(j for _, j in live) - 4
+        high_j = max(j for _, j in live) + 4
+        probes.extend(
+            (rnd.randint(low_i, high_i), rnd.randint(low_j, high_j))
+            for _ in range(len(live) + 16))
+    for i, j in probes:
+        if universe.get(i, j) != ((i, j) in live):
+            problems.append('get(%d, %d) is %s' % (i, j, universe.get(i, j)))
+            if len(problems) > 24:
+                break
+    return problems
+
+
+def check(case, store = None, rnd = None):
+    """Runs the case on both engines and returns (problems, hashlife
+    seconds, naive seconds); problems is empty when they agree"""
+    if store is None:
+        store = STORES[case['store']](rule = case['rule'])
+    live, naive_seconds = run_naive(case)
+    try:
+        universe, seconds = run_hashlife(case, store)
+    except Exception:
+        return [traceback.format_exc()], None, naive_seconds
+    rnd = rnd or random.Random(0)
+    problems = differences(case, universe, live, rnd)
+    if not problems:
+        problems = api_problems(case, universe, live, rnd)
+    return problems, seconds, naive_seconds
+
+
+def check_cycle(case, universe, live, rnd):
+    """watch() on a universe of the rule of the case, in its own store: the
+    Cycle found must bring the pattern back, moved by its displacement"""
+    watched = hashlife.HashLifeUniverse(case['n'], case['m'], rows_of(case), rule = case['rule'])
+    watched.watch()
+    watched.rounds(64)
+    cycle = watched.cycle
+    if cycle is None:
+        return []
+    before = hashlife.HashLifeUniverse(case['n'], case['m'], rows_of(case), rule = case['rule'])
+    before.rounds(cycle.start)
+    after = hashlife.HashLifeUniverse(case['n'], case['m'], rows_of(case), rule = case['rule'])
+    after.rounds(cycle.start + cycle.period)
+    di, dj = cycle.displacement
+    if set(after.live_cells()) != set((i + di, j + dj) for i, j in before.live_cells()):
+        return ['%s does not repeat the pattern' % (cycle,)]
+    return []
+
+
+def check_batch(case, universe, live, rnd):
+    """Batch of the case, its mirror image and a copy of it, stepped as the
+    case is: each must end as a universe of its own would"""
+    rows = rows_of(case)
+    mirror = rows[::-1]
+    batch = hashlife.Batch([rows, mirror, rows], rule = case['rule'])
+    batch.rounds(-1)
+    for generations in case['pieces']:
+        batch.rounds(generations, case['step'])
+    alone = hashlife.HashLifeUniverse(case['n'], case['m'], mirror, rule = case['rule'])
+    alone.rounds(sum(case['pieces']))
+    problems = []
+    for name, member, expected in (
+            ('case', batch.universes[0], live),
+            ('mirror', batch.universes[1], set(alone.live_cells())),
+            ('copy', batch.universes[2], live)):
+        if member.generation != sum(case['pieces']):
+            problems.append('batch %s at generation %d' % (name, member.generation))
+        elif set(member.live_cells()) != expected:
+            problems.append('batch %s differs from a universe of its own' % name)
+    return problems
+
+
+def check_tiles(case, universe, live, rnd):
+    """Tiles of the universe: the world is centered on (0, 0) and holds
+    every live cell, and each pixel of the non-empty tiles of a zoom is the
+    shade of population_in() over its square"""
+    tiles = hashlife.Tiles(universe, size = 8)
+    world, i0, j0 = tiles.world()
+    side = 1 << world.level
+    if (i0, j0) != (-side // 2, -side // 2):
+        return ['the world starts at (%d, %d)' % (i0, j0)]
+    if any(not (i0 <= i < i0 + side and j0 <= j < j0 + side) for i, j in live):
+        return ['the world of side %d misses live cells' % side]
+    z = rnd.randint(0, tiles.max_zoom)
+    for x, y in list(tiles._nonempty(world, z))[:4]:
+        x0, y0, x1, y1 = tiles.bounds(z, x, y)
+        span = (x1 - x0) // 8
+        pixels = tiles.pixels(z, x, y)
+        for a in range(8):
+            for b in range(8):
+                i, j = x0 + a * span, y0 + b * span
+                population = universe.population_in(i, j, i + span, j + span)
+                if pixels[a][b] != hashlife._shade(population, span * span):
+                    return ['tile (%d, %d, %d) pixel (%d, %d) differs from population_in()'
+                            % (z, x, y, a, b)]
+    return []
+
+
+def save_macrocell(universe):
+    def save(path):
+        with open(path, 'w') as file:
+            universe.save_macrocell(file)
+    return save
+
+
+def check_round_trips(case, universe, live, rnd):
+    """pack() and unpack() in the store of the universe, checkpoint() with
+    and without memo and save_macrocell(), each read back by restore():
+    the cells, generation and offset must come back as they were"""
+    problems = []
+    with hashlife.use_store(universe.store):
+        data = hashlife.pack(universe.root)
+        if hashlife.pack(hashlife.unpack(data)) != data:
+            problems.append('unpack() does not give back the packed root')
+    with tempfile.TemporaryDirectory() as directory:
+        for name, save in (('checkpoint', universe.checkpoint),
+                           ('checkpoint with memo', lambda path: universe.checkpoint(path, memo = True)),
+                           ('macrocell', save_macrocell(universe))):
+            path = os.path.join(directory, 'saved')
+            save(path)
+            restored = hashlife.HashLifeUniverse.restore(path)
+            if restored.generation != universe.generation:
+                problems.append('%s restores generation %d' % (name, restored.generation))
+            elif set(restored.live_cells()) != live:
+                problems.append('%s restores other cells' % name)
+            elif restored.store.rule.code != universe.store.rule.code:
+                problems.append('%s restores the rule %s' % (name, restored.store.rule))
+    return problems
+
+
+def check_edits(case, universe, live, rnd):
+    """set_cell() and set_cells() on the universe, on its live cells, cells
+    around them and far ones growing the root, then undone: get() and the
+    live cells must follow the edits and come back to live"""
+    probes = set(live)
+    probes.update((rnd.randint(-16, 16), rnd.randint(-16, 16)) for _ in range(16))
+    probes.update((rnd.randint(-1 << 12, 1 << 12), rnd.randint(-1 << 12, 1 << 12)) for _ in range(2))
+    probes = sorted(probes)
+    edits = [(cell, rnd.random() < 0.5) for cell in rnd.sample(probes, min(len(probes), 24))]
+    before = dict((cell, cell in live) for cell, _ in edits)
+    expected = set(live)
+    expected.difference_update(cell for cell, alive in edits if not alive)
+    expected.update(cell for cell, alive in edits if alive)
+    # one cell at a time, then the rest in two batches
+    for (i, j), alive in edits[:4]:
+        universe.set_cell(i, j, alive)
+    universe.set_cells([cell for cell, alive in edits[4:] if alive])
+    universe.set_cells([cell for cell, alive in edits[4:] if not alive], alive = False)
+    problems = []
+    for (i, j) in before:
+        if universe.get(i, j) != ((i, j) in expected):
+            problems.append('get(%d, %d) is %s after the edits' % (i, j, universe.get(i, j)))
+    if not problems and set(universe.live_cells()) != expected:
+        problems.append('the live cells differ from the edits')
+    universe.set_cells([cell for cell, alive in before.items() if alive])
+    universe.set_cells([cell for cell, alive in before.items() if not alive], alive = False)
+    if set(universe.live_cells()) != live or universe.population != len(live):
+        problems.append('undoing the edits does not give back the live cells')
+    return problems
+
+
+# checks of the APIs built on stepping, each returning a list of problems,
+# check_edits last as it edits the universe
+API_CHECKS = (check_cycle, check_batch, check_tiles, check_round_trips, check_edits)
+
+
+def api_problems(case, universe, live, rnd):
+    """Returns what the checks of API_CHECKS find wrong with the case,
+    stepped in universe to the live cells live"""
+    problems = []
+    for api in API_CHECKS:
+        try:
+            problems.extend(api(case, universe, live, rnd))
+        except Exception:
+            problems.append('%s:\n%s' % (api.__name__, traceback.format_exc()))
+    return problems
+
+
+# name: (rows, rule, period, displacement up to sign)
+KNOWN_CYCLES = {
+    'block':         ([[1, 1], [1, 1]], 'B3/S23', 1, (0, 0)),
+    'blinker':       ([[1, 1, 1]], 'B3/S23', 2, (0, 0)),
+    'glider':        ([[0, 1, 0], [0, 0, 1], [1, 1, 1]], 'B3/S23', 4, (1, 1)),
+    'highlife-blinker': ([[1, 1, 1]], 'B36/S23', 2, (0, 0)),
+    'highlife-glider':  ([[0, 1, 0], [0, 0, 1], [1, 1, 1]], 'B36/S23', 4, (1, 1)),
+}
+
+
+def known_problems():
+    """Checks the APIs on patterns whose behavior is known, returns a list
+    of messages"""
+    problems = []
+    for name, (rows, rule, period, displacement) in sorted(KNOWN_CYCLES.items()):
+        universe = hashlife.HashLifeUniverse(len(rows), len(rows[0]), rows, rule = rule)
+        cycle = universe.find_cycle(64)
+        if cycle is None or cycle.period != period or \
+                tuple(map(abs, cycle.displacement)) != displacement:
+            problems.append('%s: cycle %s, expected period %d moving %s' % (name, cycle, period, displacement))
+        universe = hashlife.HashLifeUniverse(len(rows), len(rows[0]), rows, rule = rule)
+        universe.watch()
+        universe.rounds(64)
+        if universe.cycle != cycle:
+            problems.append('%s: watch() found %s, find_cycle() %s' % (name, universe.cycle, cycle))
+    return problems
+
+
+def shrink(case, budget = 400):
+    """Returns a smaller case failing like case, with fewer generations and
+    live cells, each case run in a fresh store"""
+    def fails(candidate):
+        nonlocal budget
+        budget -= 1
+        return bool(check(candidate)[0])
+
+    if not fails(case):
+        # the failure depends on what the shared store held
+        return case
+
+    # fewer generations, piece by piece
+    index = 0
+    while index < len(case['pieces']) and budget > 0:
+        generations = case['pieces'][index]
+        for smaller in (0, generations // 2, generations - 1):
+            if 0 <= smaller < generations:
+                pieces = case['pieces'][:index] + [smaller] + case['pieces'][index + 1:]
+                if fails(dict(case, pieces = pieces)):
+                    case = dict(case, pieces = pieces)
+                    break
+        else:
+            index += 1
+    case = dict(case, pieces = [p for p in case['pieces'] if p] or [0])
+
+    # fewer live cells, halves first and then one at a time
+    chunk = len(case['live']) // 2
+    while chunk >= 1 and budget > 0:
+        index = 0
+        while index < len(case['live']) and budget > 0:
+            candidate = dict(case, live = case['live'][:index] + case['live'][index + chunk:])
+            if fails(candidate):
+                case = candidate
+            else:
+                index += chunk
+        chunk //= 2
+
+    for key, value in (('extend', 0), ('mode', 'jump')):
+        if case[key] != value and budget > 0:
+            candidate = dict(case, **{key: value})
+            if key == 'mode':
+                candidate['step'] = None
+            if fails(candidate):
+                case = candidate
+    return case
+
+
+def group_of(case):
+    """Returns the store/mode/rule group the timings of a case add up in"""
+    return '%s/%s/%s' % (case['store'], case['mode'], case['rule'])
+
+
+def report(timings, baseline = None, tolerance = 0.25, min_seconds = 1.):
+    """Prints the time of both engines per store, mode and rule and in
+    total, with the speedup to the baseline, and returns the keys that got
+    slower than tolerance allows. Keys that took less than min_seconds in
+    the baseline are too noisy to be flagged."""
+    previous = dict((t['key'], t) for t in baseline or ())
+    rows = sorted(timings.values(), key = lambda t: t['key'])
+    total = {'key': 'total'}
+    for field in ('cases', 'generations', 'hashlife_seconds', 'naive_seconds'):
+        total[field] = sum(t[field] for t in rows)
+    if baseline:
+        previous['total'] = dict(
+            (field, sum(t[field] for t in baseline))
+            for field in ('cases', 'hashlife_seconds'))
+
+    slower = []
+    columns = '%-28s %6s %10s %11s %11s %8s %9s'
+    print(columns % ('store/mode/rule', 'cases', 'gens', 'hashlife', 'naive', 'speedup', 'vs base'))
+    for timing in rows + [total]:
+        old = previous.get(timing['key'])
+        ratio = ''
+        if old and old['cases'] == timing['cases'] and old['hashlife_seconds']:
+            change = old['hashlife_seconds'] / timing['hashlife_seconds'] if timing['hashlife_seconds'] else float('inf')
+            ratio = '%.2fx' % change
+            if change < 1 / (1 + tolerance) and old['hashlife_seconds'] >= min_seconds:
+                ratio += ' !'
+                slower.append(timing['key'])
+        print(columns % (
+            timing['key'], timing['cases'], timing['generations'],
+            '%.3fs' % timing['hashlife_seconds'],
+            '%.3fs' % timing['naive_seconds'],
+            '%.1fx' % (timing['naive_seconds'] / timing['hashlife_seconds']) if timing['hashlife_seconds'] else '',
+            ratio))
+    return slower
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__.strip().splitlines()[0])
+    parser.add_argument('--cases', type = int, default = 100, help = 'number of cases (default: 100)')
+    parser.add_argument('--seed', type = int, default = 0, help = 'seed of the cases')
+    parser.add_argument('--max-size', type = int, default = 24, help = 'largest side of a soup')
+    parser.add_argument('--max-generations', type = int, default = 200, help = 'most generations of a case')
+    parser.add_argument('--store', action = 'append', choices = sorted(STORES), help = 'store to fuzz, repeatable (default: all)')
+    parser.add_argument('--mode', action = 'append', choices = MODES, help = 'schedule to fuzz, repeatable (default: all)')
+    parser.add_argument('--rule', action = 'append', help = 'rule to fuzz, repeatable (default: %s)' % ', '.join(RULES))
+    parser.add_argument('--random-rules', action = 'store_true', help = 'also fuzz random rules')
+    parser.add_argument('--edges', type = float, default = 0.25, help = 'share of cases crowding the edge of a step\'s central quarter (default: 0.25)')
+    parser.add_argument('--max-bytes', type = int, help = 'max_bytes of the stores, to fuzz eviction')
+    parser.add_argument('--max-steps', type = int, help = 'max_steps of the stores')
+    parser.add_argument('--tolerance', type = float, default = 0.25, help = 'slowdown to the baseline flagged (default: 0.25)')
+    parser.add_argument('--min-seconds', type = float, default = 1., help = 'shortest baseline time flagged (default: 1)')
+    parser.add_argument('--json', help = 'file to save the timings to')
+    parser.add_argument('--compare', help = 'timings saved by --json to compare with')
+    parser.add_argument('--replay', help = 'JSON file of a case to run alone')
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        with open(args.replay) as file:
+            problems = check(json.load(file))[0]
+        print('\n'.join(problems) or 'ok')
+        return 1 if problems else 0
+
+    known = known_problems()
+    for problem in known:
+        print(problem, file = sys.stderr)
+
+    rnd = random.Random(args.seed)
+    stores = dict()
+    timings = dict()
+    failures = []
+    for index in range(args.cases):
+        case = case_of(rnd, args)
+        kind = (case['store'], case['rule'])
+        if kind not in stores:
+            stores[kind] = STORES[case['store']](args.max_bytes, case['rule'], args.max_steps)
+        problems, seconds, naive_seconds = check(case, stores[kind], random.Random(index))
+        if problems:
+            print('case %d failed:\n  %s' % (index, '\n  '.join(problems)), file = sys.stderr)
+            failures.append(shrink(case))
+            print(json.dumps(failures[-1]), file = sys.stderr)
+            continue
+
+        timing = timings.setdefault(group_of(case), {
+            'key': group_of(case), 'cases': 0, 'generations': 0,
+            'hashlife_seconds': 0., 'naive_seconds': 0.,
+        })
+        timing['cases'] += 1
+        timing['generations'] += sum(case['pieces'])
+        timing['hashlife_seconds'] += seconds
+        timing['naive_seconds'] += naive_seconds
+
+    slower = report(timings, load_baseline(args.compare, 'timings'), args.tolerance, args.min_seconds)
+    print('%d cases, %d failed' % (args.cases, len(failures)))
+    if known:
+        print('%d known patterns failed' % len(known))
+    if slower:
+        print('slower than the baseline: %s' % ', '.join(slower))
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(dict(
+                environment(),
+                seed = args.seed,
+                cases = args.cases,
+                timings = list(timings.values()),
+                failures = failures,
+            ), file, indent = 1)
+    return 1 if failures or known or slower else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -23,13 +23,753 @@ for _ in range(n):
 node = node.forward()
 
 '''
+import array
+import concurrent.futures
+import contextlib
+import functools
+import heapq
+import itertools
 import math
+import mmap
+import operator
+import os
+import struct
+import sys
+import threading
+import time
 import weakref
+import zlib
+from collections import Counter, OrderedDict, namedtuple
 
-HC = weakref.WeakValueDictionary()
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class Rule:
+    """Outer-totalistic rule on the eight neighbours of a cell, in B/S
+    notation: a dead cell with a number of live neighbours in birth comes
+    alive, a live cell with a number of live neighbours in survival stays
+    alive. Rules compare equal by their counts.
+
+        Rule.parse('B3/S23')        # Life
+        Rule.parse('B36/S23')       # HighLife
+        Rule.parse('23/36')         # the same, survival first
+    """
+
+    def __init__(self, birth, survival):
+        self.birth = frozenset(birth)
+        self.survival = frozenset(survival)
+        if not self.birth | self.survival <= set(range(9)):
+            raise ValueError("neighbour counts go from 0 to 8")
+        self._table = None
+
+        # the sums of a cell and its neighbours after which it is alive:
+        # whatever its state, only if it was dead, only if it was alive
+        born = self.birth
+        kept = set(n + 1 for n in self.survival)
+        self.sums = tuple(tuple(sorted(x)) for x in (born & kept, born - kept, kept - born))
+        self.combine = self._compile()
+        # the next state by (state, sum), as state * 10 + sum
+        self.next = bytes(
+            (s - state in (self.survival if state else self.birth))
+            for state in (0, 1) for s in range(10))
+
+    def _compile(self):
+        """Returns the function computing the next states of a block from
+        its states x and the bits t0, b1, b2, b3 of the sums, see _life().
+        It is compiled from a Python expression, so that a rule costs no
+        more than the handwritten expression of Life."""
+        def equal(n):
+            bits = [('' if n >> i & 1 else '~') + name for i, name in enumerate(('t0', 'b1', 'b2'))]
+            # 2 to 7 cannot be mistaken for the sums from 10 up
+            if n < 2 or n > 7:
+                bits.append(('' if n >> 3 else '~') + 'b3')
+            return ' & '.join(bits)
+
+        terms = []
+        for sums, state in zip(self.sums, ('', '~x & ', 'x & ')):
+            if sums:
+                terms.append('%s(%s)' % (state, ' | '.join(map(equal, sums))))
+        return eval('lambda x, t0, b1, b2, b3: %s' % (' | '.join(terms) or '0'))
+
+    @staticmethod
+    def parse(text):
+        """Returns the rule of a string such as 'B3/S23' or '23/3' (the
+        survival first without letters), or text itself if it is a Rule"""
+        if isinstance(text, Rule):
+            return text
+        parts = text.replace(' ', '').split('/')
+        if len(parts) != 2:
+            raise ValueError("not a B/S rule: %r" % text)
+        birth = survival = None
+        for part in parts:
+            if part[:1] in ('B', 'b'):
+                birth = part[1:]
+            elif part[:1] in ('S', 's'):
+                survival = part[1:]
+        if birth is None and survival is None:
+            survival, birth = parts
+        if birth is None or survival is None or not all(ch.isdigit() for ch in birth + survival):
+            raise ValueError("not a B/S rule: %r" % text)
+        return Rule(map(int, birth), map(int, survival))
+
+    @property
+    def code(self):
+        """The rule as an 18-bit integer, the birth counts in the low bits"""
+        return sum(1 << n for n in self.birth) | sum(1 << (9 + n) for n in self.survival)
+
+    @staticmethod
+    def from_code(code):
+        return Rule(
+            (n for n in range(9) if code >> n & 1),
+            (n for n in range(9) if code >> (9 + n) & 1))
+
+    def table(self):
+        """Returns the 65536-entry table of the rule laid out as
+        life_table(), computed on first use"""
+        if self._table is None:
+            filter5 = 0b11101010111
+            filter6 = filter5 << 1
+            filter9 = 0b111010101110000
+            filter10 = filter9 << 1
+
+            table = bytearray(1 << 16)
+            for w in range(1 << 16):
+                r = 0
+                for bit, mask in ((10, filter10), (9, filter9), (6, filter6), (5, filter5)):
+                    s = bin(w & mask).count('1')
+                    if s in (self.survival if w >> bit & 1 else self.birth):
+                        r |= 1 << (bit - 5)
+                table[w] = r
+            self._table = bytes(table)
+        return self._table
+
+    def __eq__(self, other):
+        if not isinstance(other, Rule):
+            return NotImplemented
+        return self.birth == other.birth and self.survival == other.survival
+
+    def __hash__(self):
+        return hash((self.birth, self.survival))
+
+    def __str__(self):
+        return 'B%s/S%s' % (''.join(map(str, sorted(self.birth))), ''.join(map(str, sorted(self.survival))))
+
+    def __repr__(self):
+        return 'Rule(%r)' % str(self)
+
+LIFE = Rule((3,), (2, 3))
+
+class NodeStore:
+    """Canonical table of quadtree nodes with an optional memory ceiling.
+
+    Every node built through AbstractNode.cell / AbstractNode.node is
+    canonicalized here, so equal subtrees are the same object. Unlike a
+    WeakValueDictionary the table holds its nodes strongly and frees them
+    by marking from the roots of the universes using the store (plus any
+    pinned node) and sweeping what is unreachable.
+
+    Memoized forward() results follow a policy. The natural result of a
+    node, 2**(k-2) generations, lives in a slot of the node. Results for
+    other steps l live in one table per l, at most max_steps entries in
+    all (None for no limit, 0 to keep none), dropped oldest first, and
+    drop_steps(l) forgets a whole step size at once. When the store grows
+    above max_bytes, fixed-step results are dropped first and then
+    natural results, least recently used first.
+
+    The memo only holds for one rule, the rule of the store, so universes
+    of different rules live in different stores (see store_for()). B0
+    rules, which would fill the empty space, are not supported.
+
+    Several threads may work in a store at once, each inside use_store()
+    or a method of a HashLifeUniverse: nodes are inserted atomically, and
+    collect() only sweeps, under a lock, while no other thread is busy in
+    the store.
+    """
+
+    def __init__(self, max_bytes = None, rule = LIFE, max_steps = None):
+        self.rule = Rule.parse(rule)
+        if 0 in self.rule.birth:
+            raise ValueError("B0 rules are not supported")
+        self.max_bytes = max_bytes
+        self.max_steps = max_steps
+        # nodes by the ids of their children packed in one integer, from
+        # 2**192 up, and leaves by their word; the children of a node in the
+        # table are alive, so their ids are theirs
+        self._table = dict()
+        # the two cells, outside of the table
+        self._cells = None
+        # nodes owning a natural result, least recently used first, by id
+        self._memo = OrderedDict()
+        # fixed-step results by l, {id(node): (node, result)} oldest first
+        self._steps = dict()
+        self._step_entries = 0
+        self._universes = weakref.WeakSet()
+        # pinned nodes by id
+        self._pinned = dict()
+        self._node_bytes = None
+        self._leaves = None
+        self._zeros = []
+        # nodes removed by collect() so far, see created
+        self._freed = 0
+        # without a ceiling, collect whenever the table doubles
+        self._threshold = 1 << 16
+        # threads busy in the store, {thread ident: depth}
+        self._busy = dict()
+        # the (Stats, timing) pairs of the profile() blocks counting in the
+        # store, innermost last, or None
+        self._profiled = None
+        self._sweeping = False
+        self._lock = threading.RLock()
+
+    # (nw, ne, sw, se) of a node
+    children = staticmethod(operator.attrgetter('nw', 'ne', 'sw', 'se'))
+
+    # whether steps run forward_iterative(), which pays off when children()
+    # is cheaper than reading the four children one by one
+    iterative = False
+
+    def canon(self, node):
+        """Returns the canonical node equal to node, which may come from
+        another store"""
+        if node.level == 0:
+            return self.cell(node.population)
+        if isinstance(node, LeafNode):
+            return self.leaf(node.word)
+        nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+        found = self._table.get(id(nw) | id(ne) << 64 | id(sw) << 128 | id(se) << 192)
+        if found is not None:
+            return found
+        return self.node(self.canon(nw), self.canon(ne), self.canon(sw), self.canon(se))
+
+    def cell(self, alive):
+        if self._cells is None:
+            self._cells = (CellNode(0), CellNode(1))
+        return self._cells[1 if alive else 0]
+
+    def node(self, nw, ne, sw, se):
+        """Returns the canonical node of the given canonical children,
+        looked up by their identity before anything is allocated"""
+        key = id(nw) | id(ne) << 64 | id(sw) << 128 | id(se) << 192
+        node = self._table.get(key)
+        if node is not None:
+            return node
+        # level 3 nodes are leaves, level 2 children are not kept
+        if nw.level == 2:
+            return self.leaf(_word8(*(self._code2(q) for q in (nw, ne, sw, se))))
+        # setdefault is atomic, another thread may have inserted it meanwhile
+        return self._table.setdefault(key, Node(nw, ne, sw, se))
+
+    def leaf(self, word):
+        """Returns the canonical level 3 node of an 8x8 word"""
+        node = self._table.get(word)
+        if node is None:
+            node = self._table.setdefault(word, LeafNode(word))
+        return node
+
+    # the 8x8 word of a level 3 node
+    word = staticmethod(operator.attrgetter('_word'))
+
+    def _code2(self, node):
+        """Returns the 4x4 block of a level 2 node packed as in life_table()"""
+        spread = self.leaves()[0]
+        nw, ne, sw, se = self.children(node)
+        return \
+            spread[id(nw)] << 10 | spread[id(ne)] << 8 | \
+            spread[id(sw)] << 2  | spread[id(se)]
+
+    def recall(self, node, l):
+        """Returns the memoized result of node.forward(l), or None"""
+        if l == node.level - 2:
+            value = node._next
+            if value is not None and self.max_bytes is not None:
+                self._memo.move_to_end(id(node))
+            return value
+        table = self._steps.get(l)
+        if table is None:
+            return None
+        entry = table.get(id(node))
+        return None if entry is None else entry[1]
+
+    def memoize(self, node, l, result):
+        if l == node.level - 2:
+            if node._next is None:
+                self._memo[id(node)] = node
+            elif self.max_bytes is not None:
+                self._memo.move_to_end(id(node))
+            node._next = result
+            return result
+        if self.max_steps == 0:
+            return result
+        with self._lock:
+            table = self._steps.get(l)
+            if table is None:
+                table = self._steps[l] = OrderedDict()
+            if id(node) not in table:
+                self._step_entries += 1
+                if self.max_steps is not None and self._step_entries > self.max_steps:
+                    self._drop_oldest(1)
+            # the entry holds node, so its id stays its own
+            table[id(node)] = (node, result)
+        return result
+
+    def memos(self, node):
+        """Returns the memoized results of node as {l: result}, or None"""
+        memos = dict()
+        if node.level > 1 and node._next is not None:
+            memos[node.level - 2] = node._next
+        for l, table in self._steps.items():
+            entry = table.get(id(node))
+            if entry is not None:
+                memos[l] = entry[1]
+        return memos or None
+
+    def drop_steps(self, l = None):
+        """Forgets the memoized results of steps of 2**l generations, of
+        every fixed step with None; natural results are kept"""
+        with self._lock:
+            for step in ([l] if l is not None else list(self._steps)):
+                table = self._steps.pop(step, None)
+                if table is not None:
+                    self._step_entries -= len(table)
+
+    def _drop_oldest(self, count):
+        """Drops count fixed-step results, the oldest of the largest table
+        first"""
+        while count > 0 and self._step_entries:
+            l = max(self._steps, key = lambda l: len(self._steps[l]))
+            table = self._steps[l]
+            for _ in range(min(count, len(table))):
+                table.popitem(last = False)
+                self._step_entries -= 1
+                count -= 1
+            if not table:
+                del self._steps[l]
+
+    def memo_stats(self):
+        """Returns the number of natural results, of fixed-step results by
+        l, and the estimated bytes they hold beyond the nodes"""
+        return {
+            'natural': len(self._memo),
+            'steps': dict((l, len(table)) for l, table in self._steps.items()),
+            'bytes': self.memo_bytes,
+        }
+
+    def zero(self, k):
+        """Returns the canonical empty node of level k. Empty nodes are
+        built once per level and pinned, so an empty node of level k is
+        always this very object."""
+        zeros = self._zeros
+        while len(zeros) <= k:
+            if zeros:
+                temp = zeros[-1]
+                node = self.node(temp, temp, temp, temp)
+            else:
+                node = self.cell(0)
+            self.pin(node)
+            zeros.append(node)
+        return zeros[k]
+
+    def leaves(self):
+        """Returns the canonical 2x2 nodes, as a dict {id(node): bits} and
+        a list indexed by bits, where bits 5, 4, 1, 0 are the nw, ne, sw
+        and se cells. These nodes and the two cells are pinned."""
+        if self._leaves is None:
+            cells = (self.cell(0), self.cell(1))
+            spread = dict()
+            level1 = [None] * 0x34
+            for code in range(16):
+                nw, ne, sw, se = code >> 3 & 1, code >> 2 & 1, code >> 1 & 1, code & 1
+                node = self.node(cells[nw], cells[ne], cells[sw], cells[se])
+                self.pin(node)
+                bits = nw << 5 | ne << 4 | sw << 1 | se
+                spread[id(node)] = bits
+                level1[bits] = node
+            self.pin(cells[0])
+            self.pin(cells[1])
+            self._leaves = (spread, level1)
+        return self._leaves
+
+    def track(self, universe):
+        """Registers a universe whose roots() are kept alive by collect()"""
+        self._universes.add(universe)
+
+    def pin(self, node):
+        self._pinned[id(node)] = node
+
+    def unpin(self, node):
+        self._pinned.pop(id(node), None)
+
+    def evict(self, count):
+        """Drops count memoized results: fixed-step results first, then the
+        natural results of the least recently used nodes"""
+        dropped = min(count, self._step_entries)
+        self._drop_oldest(dropped)
+        memo = self._memo
+        for _ in range(min(count - dropped, len(memo))):
+            _, node = memo.popitem(last = False)
+            node._next = None
+
+    @contextlib.contextmanager
+    def busy(self):
+        """Marks the calling thread busy in the store for the block: the
+        nodes it holds while computing are not reachable from any root, so
+        no other thread may collect the store meanwhile"""
+        ident = threading.get_ident()
+        self._enter(ident)
+        try:
+            yield self
+        finally:
+            self._leave(ident)
+
+    # only the thread itself writes its entry of _busy, so entering and
+    # leaving need no lock: a thread entering during a sweep sees the
+    # flag, set before the sweep looked for busy threads, and waits
+    def _enter(self, ident):
+        self._busy[ident] = self._busy.get(ident, 0) + 1
+        if self._sweeping:
+            with self._lock:
+                pass
+
+    def _leave(self, ident):
+        depth = self._busy[ident] - 1
+        if depth:
+            self._busy[ident] = depth
+        else:
+            del self._busy[ident]
+
+    def collect(self, roots = ()):
+        """Frees every node unreachable from the roots, evicting memoized
+        results while the store is above its ceiling. Returns the number of
+        nodes removed from the table, 0 when another thread is busy in the
+        store, in which case nothing is collected."""
+        with self._lock:
+            self._sweeping = True
+            try:
+                if len(self._busy) > (threading.get_ident() in self._busy):
+                    return 0
+                freed = self._sweep(roots)
+                while self.max_bytes is not None and self.nbytes > self.max_bytes and self.memo_count:
+                    self.evict(max(1, self.memo_count // 2))
+                    freed += self._sweep(roots)
+                self._freed += freed
+            finally:
+                self._sweeping = False
+        return freed
+
+    def maybe_collect(self, roots = ()):
+        """Runs collect(roots) if the store is above its ceiling or, without
+        a ceiling, if the table has doubled since the last collection"""
+        if self.max_bytes is not None:
+            if self.nbytes > self.max_bytes:
+                self.collect(roots)
+        elif self.node_count > self._threshold:
+            self.collect(roots)
+            self._threshold = max(self._threshold, 2 * self.node_count)
+
+    def _sweep(self, roots):
+        marked = set()
+        steps = dict()
+        for table in self._steps.values():
+            for key, (_, result) in table.items():
+                steps.setdefault(key, []).append(result)
+
+        stack = [node for u in self._universes for node in u.roots()]
+        stack.extend(self._pinned.values())
+        stack.extend(roots)
+        while stack:
+            node = stack.pop()
+            if id(node) in marked:
+                continue
+            marked.add(id(node))
+            if node.level > 0 and not isinstance(node, LeafNode):
+                stack.extend((node.nw, node.ne, node.sw, node.se))
+            if node.level > 1 and node._next is not None:
+                stack.append(node._next)
+            stack.extend(steps.get(id(node), ()))
+
+        dead = [key for key, node in self._table.items() if id(node) not in marked]
+        for key in dead:
+            node = self._table.pop(key)
+            if node._next is not None:
+                self._memo.pop(id(node), None)
+                node._next = None
+        for l, table in list(self._steps.items()):
+            for key in [key for key in table if key not in marked]:
+                del table[key]
+                self._step_entries -= 1
+            if not table:
+                del self._steps[l]
+        return len(dead)
+
+    @property
+    def node_count(self):
+        # the two cells are not in the table
+        return len(self._table) + 2
+
+    @property
+    def created(self):
+        """Number of nodes ever added to the table"""
+        return self.node_count + self._freed
+
+    @property
+    def memo_count(self):
+        return len(self._memo) + self._step_entries
+
+    @property
+    def memo_nodes(self):
+        """Number of nodes owning at least one memoized result"""
+        owners = set(self._memo)
+        for table in self._steps.values():
+            owners.update(table)
+        return len(owners)
+
+    @property
+    def nbytes(self):
+        """Estimated memory held by the nodes and memoized results"""
+        if self._node_bytes is None:
+            # a node, its key and its cached hash
+            probe = Node(*([CellNode(0)] * 4))
+            self._node_bytes = \
+                sys.getsizeof(probe) + \
+                sys.getsizeof(1 << 255) + \
+                sys.getsizeof(id(probe))
+        return \
+            sys.getsizeof(self._table) + \
+            len(self._table) * self._node_bytes + \
+            self.memo_bytes
+
+    @property
+    def memo_bytes(self):
+        """Estimated memory held by the memoized results: an id and a link
+        per natural result, plus an id and a pair per fixed-step result"""
+        key = sys.getsizeof(1 << 40)
+        return \
+            sys.getsizeof(self._memo) + len(self._memo) * 2 * key + \
+            sum(map(sys.getsizeof, self._steps.values())) + \
+            self._step_entries * (key + sys.getsizeof((None, None)))
+
+    def __len__(self):
+        return self.node_count
+
+# the store every thread starts with
+STORE = NodeStore()
+
+class _Current(threading.local):
+    """The current store, one per thread, so that threads stepping
+    universes of different stores do not swap each other's store"""
+
+    def __init__(self):
+        self.store = STORE
+        # the node whose forward() call _timed_forward() is measuring
+        self.timed = None
+
+_current = _Current()
+
+def current_store():
+    """Returns the node store used by every new node in this thread"""
+    return _current.store
 
 def hc(s):
-    return HC.setdefault(s, s)
+    return _current.store.canon(s)
+
+def set_store(store):
+    """Makes store the node store used by every new node in this thread.
+    Returns the previous one. Nodes from different stores must not be
+    mixed."""
+    previous, _current.store = _current.store, store
+    return previous
+
+@contextlib.contextmanager
+def use_store(store):
+    """Makes store the current store of this thread for the block, and
+    marks the thread busy in it so that no other thread collects it
+    meanwhile"""
+    previous = set_store(store)
+    try:
+        with store.busy():
+            yield store
+    finally:
+        set_store(previous)
+
+# stores made by store_for(), by rule
+_RULE_STORES = dict()
+
+def store_for(rule):
+    """Returns the current store if it runs the given rule, else a store
+    of that rule shared by every later call"""
+    rule = Rule.parse(rule)
+    if _current.store.rule == rule:
+        return _current.store
+    if rule not in _RULE_STORES:
+        _RULE_STORES.setdefault(rule, NodeStore(rule = rule))
+    return _RULE_STORES[rule]
+
+def _in_store(method):
+    """Runs a HashLifeUniverse method with the store of the universe as
+    the current store"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        store = self._store
+        ident = threading.get_ident()
+        if store is _current.store and ident in store._busy:
+            return method(self, *args, **kwargs)
+        # use_store(store), inlined as it wraps every query
+        previous, _current.store = _current.store, store
+        store._enter(ident)
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            store._leave(ident)
+            _current.store = previous
+    return wrapper
+
+class Stats:
+    """Counters filled in by profile(), each a Counter keyed by node level.
+
+    forward_calls  forward() results requested
+    forward_time   seconds spent in forward(), children included, when
+                   profiling with timing
+    memo_hits      memo lookups finding a result
+    memo_misses    memo lookups finding none
+    base_cases     results computed from the cells themselves: 4x4 table
+                   lookups at level 2 and packed blocks at levels 3 to 5
+    canon_hits     nodes built that the store already held
+    canon_misses   nodes built that were new
+    """
+
+    FIELDS = (
+        'forward_calls', 'forward_time', 'memo_hits', 'memo_misses',
+        'base_cases', 'canon_hits', 'canon_misses')
+
+    def __init__(self):
+        for field in Stats.FIELDS:
+            setattr(self, field, Counter())
+
+    def hit_rate(self, level = None):
+        """Returns the share of memo lookups that hit, at one level or
+        overall, or None without lookups"""
+        if level is None:
+            hits, misses = sum(self.memo_hits.values()), sum(self.memo_misses.values())
+        else:
+            hits, misses = self.memo_hits[level], self.memo_misses[level]
+        return hits / (hits + misses) if hits + misses else None
+
+    def levels(self):
+        return sorted(set().union(*(getattr(self, field) for field in Stats.FIELDS)))
+
+    def as_dict(self):
+        return {field: dict(sorted(getattr(self, field).items())) for field in Stats.FIELDS}
+
+    def __str__(self):
+        columns = '%5s %10s %10s %10s %9s %10s %10s %10s %9s'
+        lines = [columns % (
+            'level', 'forward', 'hits', 'misses', 'hit rate',
+            'base', 'canon hit', 'canon new', 'time')]
+        for level in self.levels():
+            rate = self.hit_rate(level)
+            lines.append(columns % (
+                level, self.forward_calls[level], self.memo_hits[level],
+                self.memo_misses[level], '' if rate is None else '%.1f%%' % (100 * rate),
+                self.base_cases[level], self.canon_hits[level], self.canon_misses[level],
+                '%.3fs' % self.forward_time[level] if level in self.forward_time else ''))
+        return '\n'.join(lines)
+
+def _count_forward(profiled, k):
+    """Counts a forward() result requested at level k in every profile of
+    a store, returns the Stats of those that time it"""
+    timed = []
+    for stats, timing in profiled:
+        stats.forward_calls[k] += 1
+        if k == 2:
+            stats.base_cases[2] += 1
+        if timing:
+            timed.append(stats)
+    return timed
+
+def _timed_forward(node, l, timed):
+    """Returns node.forward(l), adding the time it took to every Stats of
+    timed"""
+    start = time.perf_counter()
+    _current.timed = node
+    try:
+        return node.forward(l)
+    finally:
+        elapsed = time.perf_counter() - start
+        for stats in timed:
+            stats.forward_time[node.level] += elapsed
+
+@contextlib.contextmanager
+def profile(store = None, timing = False):
+    """Counts, while the block runs, the forward() calls, memo lookups,
+    base cases and nodes built in store, level by level, into the Stats it
+    yields. store may also be a HashLifeUniverse, whose store is then
+    counted, and defaults to the active store:
+
+        with profile(universe) as stats:
+            universe.rounds(1000)
+        print(stats)
+
+    Only the work done in store is counted, whatever other threads run in
+    other stores, and blocks nest. The counting wrappers of the store are
+    only installed for the duration of the block; outside of it the cost
+    is a test per forward() call and per node forward_iterative() visits.
+    With timing the time spent in forward() calls and forward_iterative()
+    frames is measured too, at the price of a clock read per call or
+    frame; memo hits and base cases resolved within a frame count in its
+    time. Steps run by forward_parallel() only count in the process
+    building the root."""
+    if isinstance(store, HashLifeUniverse):
+        store = store._store
+    store = _current.store if store is None else store
+    stats = Stats()
+    recall, node, leaf = store.recall, store.node, store.leaf
+    names = ('recall', 'node', 'leaf')
+    shadowed = {name: store.__dict__[name] for name in names if name in store.__dict__}
+    # nodes built while building another one are not counted
+    depth = [0]
+
+    def counted_recall(node, l):
+        value = recall(node, l)
+        if value is None:
+            stats.memo_misses[node.level] += 1
+        else:
+            stats.memo_hits[node.level] += 1
+        return value
+
+    def counted(build, level, *args):
+        size = store.node_count
+        depth[0] += 1
+        try:
+            result = build(*args)
+        finally:
+            depth[0] -= 1
+        if depth[0] == 0:
+            if store.node_count > size:
+                stats.canon_misses[level] += 1
+            else:
+                stats.canon_hits[level] += 1
+        return result
+
+    def counted_node(nw, ne, sw, se):
+        return counted(node, nw.level + 1, nw, ne, sw, se)
+
+    def counted_leaf(word):
+        return counted(leaf, 3, word)
+
+    store.recall, store.node, store.leaf = counted_recall, counted_node, counted_leaf
+    profiled = store._profiled
+    store._profiled = (profiled or ()) + ((stats, timing),)
+    try:
+        yield stats
+    finally:
+        store._profiled = profiled
+        for name in names:
+            if name in shadowed:
+                setattr(store, name, shadowed[name])
+            else:
+                delattr(store, name)
 
 GROUP = ["mert.unsal@polytechnique.edu", "aleksandra.petkovic@polytechnique.edu"]
 
@@ -50,51 +790,532 @@ class Universe:
             self.round()
               
 class NaiveUniverse(Universe):
-    def __init__(self, n, m, cells):
+    """Dense n x m grid stepped cell by cell, for soups where the memo of
+    HashLifeUniverse does not help and as a reference for it.
+
+    The grid lives in two buffers with a one-cell margin that are swapped
+    every generation, so stepping allocates nothing. With topology
+    'bounded' the cells outside of the grid are dead; with 'torus' the
+    grid wraps around and the margin is refilled from the opposite edges
+    before each step. Each cell is counted together with its eight
+    neighbours, with NumPy a row pass and a column pass over the whole
+    grid, and its next state is read from Rule.next by its state and
+    count.
+    """
+
+    TOPOLOGIES = ('bounded', 'torus')
+
+    def __init__(self, n, m, cells, topology = 'bounded', rule = LIFE):
+        if topology not in NaiveUniverse.TOPOLOGIES:
+            raise ValueError("unknown topology %r" % topology)
         self.n = n
         self.m = m
-        self.cells = cells
+        self.topology = topology
+        self.rule = Rule.parse(rule)
+
+        if np is not None:
+            self._grid = np.zeros((n + 2, m + 2), np.uint8)
+            self._next = np.zeros((n + 2, m + 2), np.uint8)
+            self._grid[1:-1, 1:-1] = np.asarray(cells, bool).reshape(n, m)
+            # sums of three cells along a row, then of three rows
+            self._rows = np.zeros((n + 2, m), np.uint8)
+            self._sums = np.zeros((n, m), np.uint8)
+            self._next_state = np.frombuffer(self.rule.next, np.uint8)
+        else:
+            self._grid = [[0] * (m + 2) for _ in range(n + 2)]
+            self._next = [[0] * (m + 2) for _ in range(n + 2)]
+            for i in range(n):
+                for j in range(m):
+                    self._grid[i + 1][j + 1] = 1 if cells[i][j] else 0
+
+    def _wrap(self, grid):
+        """Copies the opposite edges of a torus into the margin"""
+        if np is not None:
+            grid[0, 1:-1] = grid[-2, 1:-1]
+            grid[-1, 1:-1] = grid[1, 1:-1]
+            grid[:, 0] = grid[:, -2]
+            grid[:, -1] = grid[:, 1]
+        else:
+            grid[0][1:-1] = grid[-2][1:-1]
+            grid[-1][1:-1] = grid[1][1:-1]
+            for row in grid:
+                row[0], row[-1] = row[-2], row[1]
 
     def round(self):
-        
-        temp = [[self.get(i,j) for j in range(self.m)] for i in range(self.n)]
-        # since we already do n*m operations in the following loop, creating this list doesn't change the asymptotic complexity
-        # but it makes the implementation easier so we use it. THIS IS NOT THE HARD PART ANYWAY :D
-        
-        for i in range(self.n):
-            for j in range(self.m):
-                alive_cells = 0
-                
-                for k1 in {-1,0,1}:
-                    for k2 in {-1,0,1}:
-                        if (k1 != 0 or k2 != 0) and i + k1 < self.n and i+k1 >= 0 and j + k2 < self.m and j + k2 >= 0:
-                            if self.get(i+k1, j+k2):
-                                alive_cells += 1
-                            
-                if self.get(i,j):
-                    if alive_cells < 2 or alive_cells > 3:
-                        temp[i][j] = False
-                    
-                else:
-                    if alive_cells == 3:
-                        temp[i][j] = True     
-                
-                print(i,j,self.get(i,j),alive_cells)
-        
-        self.cells = temp
+        grid, new = self._grid, self._next
+        if self.topology == 'torus':
+            self._wrap(grid)
+
+        if np is not None:
+            rows, sums = self._rows, self._sums
+            np.add(grid[:, :-2], grid[:, 1:-1], out = rows)
+            np.add(rows, grid[:, 2:], out = rows)
+            np.add(rows[:-2], rows[1:-1], out = sums)
+            np.add(sums, rows[2:], out = sums)
+            # state * 10 + sum indexes Rule.next
+            np.multiply(grid[1:-1, 1:-1], 10, out = rows[:-2])
+            np.add(sums, rows[:-2], out = sums)
+            np.take(self._next_state, sums, out = new[1:-1, 1:-1])
+        else:
+            table = self.rule.next
+            for i in range(1, self.n + 1):
+                above, row, below, out = grid[i - 1], grid[i], grid[i + 1], new[i]
+                for j in range(1, self.m + 1):
+                    s = \
+                        above[j - 1] + above[j] + above[j + 1] + \
+                        row[j - 1]   + row[j]   + row[j + 1] + \
+                        below[j - 1] + below[j] + below[j + 1]
+                    out[j] = table[10 * row[j] + s]
+
+        self._grid, self._next = new, grid
 
     def get(self, i, j):
-        return self.cells[i][j]
+        if self.topology == 'torus':
+            i, j = i % self.n, j % self.m
+        elif not (0 <= i < self.n and 0 <= j < self.m):
+            return False
+        if np is not None:
+            return bool(self._grid[i + 1, j + 1])
+        return bool(self._grid[i + 1][j + 1])
+
+    @property
+    def cells(self):
+        """The grid, as a NumPy boolean array or as lists of booleans"""
+        if np is not None:
+            return self._grid[1:-1, 1:-1].astype(bool)
+        return [[bool(x) for x in row[1:-1]] for row in self._grid[1:-1]]
+
+    @property
+    def population(self):
+        if np is not None:
+            return int(np.count_nonzero(self._grid[1:-1, 1:-1]))
+        return sum(sum(row[1:-1]) for row in self._grid[1:-1])
     
+def life_table():
+    """Returns the 65536-entry table mapping a 4x4 block to its 2x2 center
+    one generation later in Life (see Rule.table() for other rules).
+
+    The block is a 16-bit word, row by row from the bottom (j = -2) to the
+    top (j = 1), each row holding four cells from east (low bit) to west.
+    The result uses the same layout restricted to the center: the bits
+    5, 4, 1, 0 hold the nw, ne, sw and se cells.
+    """
+    return LIFE.table()
+
+def _cells8(word):
+    """Returns the cells of a leaf word as an 8x8 NumPy boolean array
+    indexed like get() from the corner"""
+    lanes = np.frombuffer(word.to_bytes(8, 'little'), dtype = np.uint8)
+    return np.unpackbits(lanes).reshape(8, 8).T.astype(bool)
+
+def _blocks(node, x0, y0, x1, y1, level):
+    """Yields (node, i, j) for every non-empty node of the given level
+    below node intersecting [x0, x1) x [y0, y1), (i, j) being its smallest
+    coordinates"""
+    children = _current.store.children
+    half = (1 << node.level) >> 1
+    stack = [(node, -half, -half)]
+    while stack:
+        node, i, j = stack.pop()
+        size = 1 << node.level
+        if node.population == 0 or i >= x1 or j >= y1 or i + size <= x0 or j + size <= y0:
+            continue
+        if node.level == level:
+            yield node, i, j
+            continue
+        h = size >> 1
+        nw, ne, sw, se = children(node)
+        stack.extend(((nw, i, j + h), (ne, i + h, j + h), (sw, i, j), (se, i + h, j)))
+
+def _extent(node, axis, low):
+    """Returns the smallest (low) or largest coordinate along axis (0 for i,
+    1 for j) of a live cell below a non-empty node. The nearest quadrants
+    are searched first and quadrants that cannot improve are skipped."""
+    children = _current.store.children
+    best = None
+    half = (1 << node.level) >> 1
+    stack = [(node, -half, -half)]
+    while stack:
+        node, i, j = stack.pop()
+        if node.population == 0:
+            continue
+        size = 1 << node.level
+        start = (i, j)[axis]
+        if best is not None and (start >= best if low else start + size - 1 <= best):
+            continue
+        if node.level == 0:
+            best = start
+            continue
+        if node.level == 3:
+            lanes = _current.store.word(node).to_bytes(8, 'little')
+            if axis == 0:
+                # the rows present, row r being bit 7 - r of a lane
+                rows = 0
+                for lane in lanes:
+                    rows |= lane
+                offset = 8 - rows.bit_length() if low else 7 - ((rows & -rows).bit_length() - 1)
+            else:
+                present = [c for c in range(8) if lanes[c]]
+                offset = present[0] if low else present[-1]
+            if best is None or (start + offset < best if low else start + offset > best):
+                best = start + offset
+            continue
+        h = size >> 1
+        nw, ne, sw, se = children(node)
+        quads = [(nw, i, j + h), (ne, i + h, j + h), (sw, i, j), (se, i + h, j)]
+        # the last pushed is searched first
+        quads.sort(key = lambda q: q[1 + axis], reverse = low)
+        stack.extend(quads)
+    return best
+
+def _level2(code):
+    """Returns the level 2 node of a 4x4 block packed as in life_table()"""
+    level1 = _current.store.leaves()[1]
+    return _current.store.node(
+        level1[code >> 10 & 0x33], level1[code >> 8 & 0x33],
+        level1[code >> 2  & 0x33], level1[code       & 0x33])
+
+def _level3(rows):
+    """Returns the level 3 node of an 8x8 block given as eight rows, from
+    the top, whose bit c is the cell of column c"""
+    word = 0
+    for r, row in enumerate(rows):
+        for c in range(8):
+            if row >> c & 1:
+                word |= 1 << (8 * c + 7 - r)
+    return _current.store.leaf(word)
+
+def _center(node):
+    """Returns the node of level k-1 at the center of a node of level k"""
+    return _current.store.node(node.nw.se, node.ne.sw, node.sw.ne, node.se.nw)
+
+def _shrink(node, level):
+    """Returns the center of node at the given level, when node is bigger"""
+    while node.level > max(level, 1):
+        node = _center(node)
+    if level == 0 and node.level == 1:
+        node = node.ne
+    return node
+
+def _edit(node, edits):
+    """Returns node with the cells (i, j) of edits, relative to its center,
+    set to alive, the last edit of a cell winning. Only the nodes above
+    the edited cells are rebuilt, every other subtree is shared."""
+    k = node.level
+    if k == 0:
+        return _current.store.cell(edits[-1][2])
+    if k == 3:
+        word = _current.store.word(node)
+        for i, j, alive in edits:
+            bit = 1 << (8 * (j + 4) + 3 - i)
+            word = word | bit if alive else word & ~bit
+        return _current.store.leaf(word)
+    if k == 1:
+        # the four cells are at (0, 0), (0, -1), (-1, -1) and (-1, 0)
+        cells = dict(zip(((-1, 0), (0, 0), (-1, -1), (0, -1)), _current.store.children(node)))
+        for i, j, alive in edits:
+            cells[i, j] = _current.store.cell(alive)
+        return _current.store.node(cells[-1, 0], cells[0, 0], cells[-1, -1], cells[0, -1])
+
+    h = 1 << (k - 2)
+    quads = ([], [], [], [])
+    for i, j, alive in edits:
+        # nw, ne, sw, se by (i >= 0, j >= 0), relative to their centers
+        q = (2 if j < 0 else 0) + (i >= 0)
+        quads[q].append((i - h if i >= 0 else i + h, j - h if j >= 0 else j + h, alive))
+    return _current.store.node(*(
+        _edit(child, quad) if quad else child
+        for child, quad in zip(_current.store.children(node), quads)))
+
+def _subsquare(node, a, b):
+    """Returns the node of level k-1 made of the 2x2 grandchildren of a
+    node of level k, at least 2, starting at the grandchild (a, b), a along
+    i and b along j, both from 0 to 2"""
+    children = _current.store.children
+    if not a & 1 and not b & 1:
+        nw, ne, sw, se = children(node)
+        return (ne if b else se) if a else (nw if b else sw)
+    def grandchild(x, y):
+        nw, ne, sw, se = children(node)
+        q = (ne if y > 1 else se) if x > 1 else (nw if y > 1 else sw)
+        nw, ne, sw, se = children(q)
+        return (ne if y & 1 else se) if x & 1 else (nw if y & 1 else sw)
+    return _current.store.node(
+        grandchild(a, b + 1), grandchild(a + 1, b + 1),
+        grandchild(a, b), grandchild(a + 1, b))
+
+def _nearest(u, q):
+    """Returns the subsquare holding a square of size q at u along one
+    axis, from 0 to 3 * q, preferring the children (0 and 2)"""
+    return 0 if u <= q else 2 if u >= 2 * q else 1
+
+def _shift(node, u, v, memo):
+    """Returns the node of level k-1 whose corner is at (u, v) from the
+    corner of a node of level k, at least 4, u and v from 0 to 2**(k-1).
+    A shifted tree shifts all its nodes of a level by the same amount, so
+    memo (a dict) rebuilds every distinct subtree once."""
+    k = node.level
+    if node.population == 0:
+        return _current.store.zero(k - 1)
+    q = 1 << (k - 2)
+    if not u % q and not v % q:
+        return _subsquare(node, u // q, v // q)
+    key = (id(node), u, v)
+    if key in memo:
+        return memo[key][1]
+
+    if k == 4:
+        # rows u to u + 7 of the lanes v to v + 7 of the 16x16 block
+        x = _join(*map(_current.store.word, _current.store.children(node)), 8)
+        word = 0
+        for c in range(8):
+            word |= (x >> (16 * (v + c) + 8 - u) & 0xFF) << 8 * c
+        result = _current.store.leaf(word)
+    else:
+        # each quadrant of the result is inside one of the nine subsquares
+        quads = []
+        for du, dv in ((0, q), (q, q), (0, 0), (q, 0)):
+            a, b = _nearest(u + du, q), _nearest(v + dv, q)
+            quads.append(_shift(_subsquare(node, a, b), u + du - a * q, v + dv - b * q, memo))
+        result = _current.store.node(*quads)
+    # the entry holds node, so its id stays its own
+    memo[key] = (node, result)
+    return result
+
+def _window(node, u, v, k):
+    """Returns the node of level k, at least 3 and below the level of node,
+    whose corner is at (u, v) from the corner of node, when it is inside"""
+    while node.level > k + 1:
+        q = 1 << (node.level - 2)
+        a, b = _nearest(u, q), _nearest(v, q)
+        node, u, v = _subsquare(node, a, b), u - a * q, v - b * q
+    return _shift(node, u, v, dict())
+
+def _align(node, oi, oj, zoom):
+    """Returns a node holding the cells of node, which is centered on
+    (oi, oj), and its own center, a multiple of 2**zoom along both axes:
+    the squares of a 2**zoom grid are then nodes of the result"""
+    while node.level < max(zoom + 1, 3):
+        node = node.extend()
+    k = node.level
+    size = 1 << zoom
+    # the corner of the result is at most size cells before the corner of
+    # node extended once, so that it holds node as size <= 2**(k-1)
+    ci, cj = (oi - (1 << k)) // size * size, (oj - (1 << k)) // size * size
+    outer = node.extend().extend()
+    node = _window(outer, ci - oi + (1 << (k + 1)), cj - oj + (1 << (k + 1)), k + 1)
+    return node, (ci + (1 << k), cj + (1 << k))
+
+def _steps(n, step = None):
+    """Returns the exponents l of the steps 2**l taking n generations:
+    steps of 2**step as long as they fit, then the binary decomposition of
+    what is left, largest first"""
+    if n <= 0:
+        return []
+    steps = []
+    if step is not None:
+        steps.extend([step] * (n >> step))
+        n &= (1 << step) - 1
+    while n:
+        l = n.bit_length() - 1
+        steps.append(l)
+        n -= 1 << l
+    return steps
+
+def _factors(n):
+    """Yields the prime factors of n, with multiplicity"""
+    p = 2
+    while p * p <= n:
+        while n % p == 0:
+            yield p
+            n //= p
+        p += 1
+    if n > 1:
+        yield n
+
+class Cycle(namedtuple('Cycle', 'start period displacement')):
+    """A pattern that repeats: from generation start on, every period
+    generations it is the same again moved by displacement (di, dj). An
+    empty universe is a still life."""
+
+    __slots__ = ()
+
+    @property
+    def kind(self):
+        if self.displacement != (0, 0):
+            return 'spaceship'
+        return 'still life' if self.period == 1 else 'oscillator'
+
+def rle_header(line):
+    """Parses an RLE header line such as 'x = 3, y = 3, rule = B3/S23'"""
+    header = dict()
+    for item in line.split(','):
+        if '=' in item:
+            key, value = (part.strip() for part in item.split('=', 1))
+            header[key] = int(value) if key in ('x', 'y') else value
+    return header
+
+def read_rle(lines):
+    """Yields the live cells of the body of an RLE pattern as (row, column)
+    pairs, reading lines lazily. Comment and header lines are skipped."""
+    row = col = 0
+    count = ''
+    for line in lines:
+        line = line.strip()
+        if not line or line[0] in '#x':
+            continue
+        for ch in line:
+            if ch.isdigit():
+                count += ch
+                continue
+            n = int(count) if count else 1
+            count = ''
+            if ch == 'b' or ch == '.':
+                col += n
+            elif ch == '$':
+                row += n
+                col = 0
+            elif ch == '!':
+                return
+            elif ch.isalpha():
+                for c in range(col, col + n):
+                    yield (row, c)
+                col += n
+
+# A square block of size x size cells packs into an integer as the 4x4
+# blocks of life_table() do: bit size * c + size - 1 - r holds the cell
+# at row r and column c from the corner, r and c growing with i and j, so
+# every column is a lane of size bits. The 8x8 blocks of leaves are
+# 64-bit words.
+
+def _spread4(code):
+    """Moves the four 4-bit lanes of a 4x4 block to the low half of the
+    four lowest bytes of a word"""
+    return code & 0xF | (code & 0xF0) << 4 | (code & 0xF00) << 8 | (code & 0xF000) << 12
+
+def _gather4(word):
+    """Inverse of _spread4(), ignoring the other bits"""
+    return word & 0xF | word >> 4 & 0xF0 | word >> 8 & 0xF00 | word >> 12 & 0xF000
+
+def _word8(nw, ne, sw, se):
+    """Packs the four 4x4 quadrants of an 8x8 block into a word"""
+    return _spread4(nw) << 36 | _spread4(ne) << 32 | _spread4(sw) << 4 | _spread4(se)
+
+def _quarters8(word):
+    """Returns the four 4x4 quadrants (nw, ne, sw, se) of an 8x8 word"""
+    return _gather4(word >> 36), _gather4(word >> 32), _gather4(word >> 4), _gather4(word)
+
+_LANE_TYPES = dict(
+    (array.array(code).itemsize * 8, code) for code in reversed('BHILQ'))
+
+def _lanes(x, count, bits):
+    """Returns the count lanes of the given bits of x, lowest first"""
+    lanes = array.array(_LANE_TYPES[bits])
+    lanes.frombytes(x.to_bytes(count * bits // 8, 'little'))
+    if sys.byteorder == 'big':
+        lanes.byteswap()
+    return lanes
+
+def _unlanes(lanes):
+    if sys.byteorder == 'big':
+        lanes.byteswap()
+    return int.from_bytes(lanes.tobytes(), 'little')
+
+def _join(nw, ne, sw, se, size):
+    """Packs four blocks of size x size cells, size at least 8, into the
+    block of twice the size they are the quadrants of"""
+    out = array.array(_LANE_TYPES[size], bytes(size * size // 2))
+    # a lane of the result is a lane of its quadrants of small i (nw, sw)
+    # above a lane of its quadrants of large i (ne, se)
+    out[0:2 * size:2] = _lanes(se, size, size)
+    out[1:2 * size:2] = _lanes(sw, size, size)
+    out[2 * size::2]  = _lanes(ne, size, size)
+    out[2 * size + 1::2] = _lanes(nw, size, size)
+    return _unlanes(out)
+
+def _split(x, size):
+    """Inverse of _join(), returns the quadrants (nw, ne, sw, se) of a
+    block of size x size cells, size at least 16"""
+    lanes = _lanes(x, 2 * size, size // 2)
+    return \
+        _unlanes(lanes[size + 1::2]), _unlanes(lanes[size::2]), \
+        _unlanes(lanes[1:size:2]), _unlanes(lanes[0:size:2])
+
+def _crop(x, size):
+    """Returns the block of size/2 x size/2 cells at the center of a block
+    of size x size cells"""
+    h, q = size >> 1, size >> 2
+    mask = (1 << h) - 1
+    out = 0
+    for c in range(h):
+        out |= (x >> (size * (c + q) + q) & mask) << (h * c)
+    return out
+
+def _life(x, size, gens, rule):
+    """Advances a block of size x size cells gens generations, with every
+    cell outside of it dead, on all the cells at once: the neighbourhood
+    sums are computed with bitwise adders on whole blocks. The cells less
+    than gens away from the border are wrong afterwards."""
+    combine = rule.combine
+    full = (1 << size * size) - 1
+    low = full // ((1 << size) - 1)
+    notlow, nothigh = full ^ low, full ^ low << (size - 1)
+    for _ in range(gens):
+        # the two neighbours within the lane, sum in (s1, s0)
+        a = x << 1 & notlow
+        b = x >> 1 & nothigh
+        s0 = x ^ a ^ b
+        s1 = x & a | b & (x ^ a)
+        # plus the sums of the two neighbouring lanes, in (b3, b2, b1, t0)
+        l0, l1 = s0 << size & full, s1 << size & full
+        r0, r1 = s0 >> size, s1 >> size
+        t0 = s0 ^ l0 ^ r0
+        c0 = s0 & l0 | r0 & (s0 ^ l0)
+        u = s1 ^ l1 ^ r1
+        v = s1 & l1 | r1 & (s1 ^ l1)
+        b1 = u ^ c0
+        c1 = u & c0
+        b2 = v ^ c1
+        b3 = v & c1
+        # the sum counts the cell itself, see Rule.sums
+        x = combine(x, t0, b1, b2, b3) & full
+    return x
+
+def forward_block(node, gens):
+    """Computes the center of a node of level 3, 4 or 5 gens generations
+    later (at most a quarter of its size), working on its cells packed in
+    one integer: returns a level 2 node, a leaf or a node of four leaves."""
+    word, children = _current.store.word, _current.store.children
+    k = node.level
+    if _current.store._profiled is not None:
+        for stats, _ in _current.store._profiled:
+            stats.base_cases[k] += 1
+    if k == 3:
+        x = word(node)
+    elif k == 4:
+        x = _join(*map(word, children(node)), 8)
+    else:
+        x = _join(*(_join(*map(word, children(q)), 8) for q in children(node)), 16)
+
+    size = 1 << k
+    x = _crop(_life(x, size, gens, _current.store.rule), size)
+    if k == 3:
+        return _level2(x)
+    if k == 4:
+        return _current.store.leaf(x)
+    leaf = _current.store.leaf
+    return _current.store.node(*(leaf(q) for q in _split(x, 16)))
+
 class AbstractNode:
-    
-    def __init__(self):
-        self._hash = None
-        self._cache = None
+    """Base of the quadtree nodes. Nodes are immutable, their subclasses
+    keep level, population and the children in slots."""
+
+    __slots__ = ()
         
     @property
     def cache(self):
-        return self._cache
+        """The memoized forward() results of the node as {l: node}, or None"""
+        return _current.store.memos(self)
         
     def __hash__(self):
         if self._hash is None:
@@ -138,20 +1359,15 @@ class AbstractNode:
     
     @staticmethod
     def cell(alive):
-        node = CellNode(alive)
-        return AbstractNode.canon(node)
+        return _current.store.cell(alive)
     
     @staticmethod
     def node(nw, ne, sw, se):
-        node = Node(nw, ne, sw, se)
-        return AbstractNode.canon(node)
+        return _current.store.node(nw, ne, sw, se)
     
     @staticmethod
     def zero(k):
-        if k == 0:
-            return AbstractNode.cell(0)
-        temp = AbstractNode.zero(k-1)
-        return AbstractNode.node(temp, temp, temp, temp)
+        return _current.store.zero(k)
         
     def extend(self):
         if self.level == 0:
@@ -176,33 +1392,38 @@ class AbstractNode:
             else:
                 return False
         
-        l = 2**(k-1)
+        l = 1 << (k-1)
         if i >= l or i < -l or j >= l or j < -l:
             return False
         
         while k > 1:
+            # i and j are relative to the center of the node
+            if k == 3:
+                return _current.store.word(node) >> (8 * (j + 4) + 3 - i) & 1
+
+            l >>= 1
 
             if i >= 0 and j >= 0:
                 node = node.ne
-                i -= 2**(k-2)
-                j -= 2**(k-2)
+                i -= l
+                j -= l
                 
             elif i >= 0 and j < 0:
                 node = node.se
-                i -= 2**(k-2)
-                j += 2**(k-2)             
+                i -= l
+                j += l
 
             elif i < 0 and j < 0:
                 node = node.sw
-                i += 2**(k-2)
-                j += 2**(k-2)          
+                i += l
+                j += l
 
             else:
                 node = node.nw
-                i += 2**(k-2)
-                j -= 2**(k-2)          
+                i += l
+                j -= l
                 
-            k = node.level
+            k -= 1
         
         if i == 0 and j == 0:
             return node.ne.population
@@ -213,101 +1434,57 @@ class AbstractNode:
         else:
             return node.nw.population
             
+    def set(self, i, j, alive = True):
+        """Returns this node with the cell (i, j), as in get(), set to
+        alive. The nodes on the path to the cell are rebuilt, the rest of
+        the tree and its memoized results are shared."""
+        half = (1 << self.level) >> 1
+        if not (-half <= i < max(half, 1) and -half <= j < max(half, 1)):
+            raise ValueError("(%d, %d) is outside of the node" % (i, j))
+        return _edit(self, [(i, j, alive)])
+
     def forward(self, l = None):
         
         k = self.level
         if k < 2:
             return None
 
+        profiled = _current.store._profiled
+        if profiled is not None:
+            if _current.timed is self:
+                # the call _timed_forward() is measuring
+                _current.timed = None
+            else:
+                timed = _count_forward(profiled, k)
+                if timed:
+                    return _timed_forward(self, l, timed)
+
         # the base case
         if l is not None:
             if l == k - 2:
-                l = None       
+                l = None
+
+        # 4x4 blocks are looked up directly and not memoized
+        if k == 2:
+            spread, level1 = _current.store.leaves()
+            w = \
+                spread[id(self.nw)] << 10 | spread[id(self.ne)] << 8 | \
+                spread[id(self.sw)] << 2  | spread[id(self.se)]
+            return level1[_current.store.rule.table()[w]]
 
         if l is None:
             
-            # cache will be a dictionary such that {key: value} = {l: l forward return}
-            if self.cache is not None:
-                value = None
-                try:
-                    value = self.cache[k-2]
-                except:
-                    pass
-                if value is not None:
-                    return value
+            # the memoized result, kept by the store under its memo policy
+            value = _current.store.recall(self, k-2)
+            if value is not None:
+                return value
             
             if self.population == 0:
                 return AbstractNode.zero(k-1)
             
-            if k == 2:
-                
-                cell1 = self.nw.se.population
-                cell2 = self.ne.sw.population
-                cell3 = self.sw.ne.population
-                cell4 = self.se.nw.population
-                
-                cells = [cell1, cell2, cell3, cell4]
-                
-                filter5 = 0b11101010111
-                filter6 = filter5 << 1
-                filter9 = 0b111010101110000
-                filter10 = filter9 << 1
-                
-                w = 0
-                w += self.se.se.population << 0 
-                w += self.se.sw.population << 1 
-                w += self.sw.se.population << 2
-                w += self.sw.sw.population << 3
-                w += self.se.ne.population << 4
-                w += self.se.nw.population << 5
-                w += self.sw.ne.population << 6
-                w += self.sw.nw.population << 7
-                w += self.ne.se.population << 8
-                w += self.ne.sw.population << 9
-                w += self.nw.se.population << 10
-                w += self.nw.sw.population << 11
-                w += self.ne.ne.population << 12
-                w += self.ne.nw.population << 13
-                w += self.nw.ne.population << 14
-                w += self.nw.nw.population << 15
-                
-                w5 = w & filter5
-                w6 = w & filter6
-                w9 = w & filter9
-                w10 = w & filter10
-                
-                ls = [w10,w9,w6,w5]
-                s = [0,0,0,0]
-                
-                for i in range(4):
-                    while ls[i] != 0:
-                        ls[i] &= ls[i] - 1
-                        s[i] += 1
-                
-                states = []
-                
-                for i in range(4):
-                    if cells[i]:
-                        if s[i] == 2 or s[i] == 3:
-                            states.append(1)
-                        else:
-                            states.append(0)
-                    else:
-                        if s[i] == 3:
-                            states.append(1)
-                        else:
-                            states.append(0)
-                            
-                nw = AbstractNode.cell(states[0])
-                ne = AbstractNode.cell(states[1])
-                sw = AbstractNode.cell(states[2])
-                se = AbstractNode.cell(states[3])
-                
-                node = AbstractNode.node(nw, ne, sw, se)
-                if self.cache is None:
-                    self._cache = dict()
-                self._cache[k-2] = node
-                return node
+            # leaves and nodes of leaves are evaluated as a whole
+            if k < 5:
+                return _current.store.memoize(self, k-2, forward_block(self, 1 << (k-2)))
             
             else:
                 
@@ -335,25 +1512,22 @@ class AbstractNode:
                 SE = AbstractNode.node(RCC, RCR, RBC, RSE).forward()
                 
                 node = AbstractNode.node(NW,NE,SW,SE)
-                if self.cache is None:
-                    self._cache = dict()
-                self._cache[k-2] = node
-                return node
+                return _current.store.memoize(self, k-2, node)
         
         else:
                     
-            if self.cache is not None:
-                value = None
-                try:
-                    value = self.cache[l]
-                except:
-                    pass
-                if value is not None:
-                    return value
+            value = _current.store.recall(self, l)
+            if value is not None:
+                return value
+
+            if self.population == 0:
+                return AbstractNode.zero(k-1)
+
+            if k < 6:
+                return _current.store.memoize(self, l, forward_block(self, 1 << l))
                     
-            k = self.level
             
-            # we know for sure that k>2, i.e. this exists because for k = 2 l has to take the value 0, hence it will be included in the case where l == k-2 
+            # we know for sure that k>5, so that the great-grandchildren below are at least leaves
             RNW = AbstractNode.node(self.nw.nw.se, self.nw.ne.sw, self.nw.sw.ne, self.nw.se.nw) 
             RNE = AbstractNode.node(self.ne.nw.se, self.ne.ne.sw, self.ne.sw.ne, self.ne.se.nw)
             RSW = AbstractNode.node(self.sw.nw.se, self.sw.ne.sw, self.sw.sw.ne, self.sw.se.nw)
@@ -377,23 +1551,137 @@ class AbstractNode:
             SE = ASE.forward(l)
             
             node = AbstractNode.node(NW,NE,SW,SE)
-            if self.cache is None:
-                self._cache = dict()
-            self._cache[l] = node
-            return node            
+            return _current.store.memoize(self, l, node)
             
+    def forward_iterative(self, l = None, check = None):
+        """Same as forward(l), computed with an explicit work stack instead
+        of recursion. Both share the same memo and canonical nodes.
+
+        Each frame is [node, l, stage, subtasks, results, sub]: subtasks
+        are the nodes whose forward(sub) the frame waits for, and stage
+        tells what to do once they are all in results.
+
+        check, if given, is called before every new frame and may raise to
+        abandon the computation; the results memoized so far are kept.
+
+        It is slower than forward() on a NodeStore, by 10 to 20%, and about
+        1.5 times faster on a TableStore, where it reads the four children
+        of a node in one call: universes step with it on stores marked
+        iterative, or when given check, and with forward() otherwise."""
+        if _current.store._profiled is not None:
+            _count_forward(_current.store._profiled, self.level)
+        value = _resolve(self, l)
+        if value is None:
+            value = _run(self, l, check)
+        return value
+
+    def get_region(self, x0, y0, x1, y1, zoom = 0):
+        """Returns the cells of [x0, x1) x [y0, y1) as a NumPy boolean array
+        indexed like get() from (x0, y0), in a single traversal that skips
+        empty subtrees and fills 8x8 blocks at once.
+
+        With zoom > 0 each entry is the density of a 2**zoom square block,
+        read from the population of the node covering it; x0 and y0 must
+        then be multiples of 2**zoom."""
+        if np is None:
+            raise ImportError("get_region requires numpy")
+        size = 1 << zoom
+        if x0 % size or y0 % size:
+            raise ValueError("x0 and y0 must be multiples of 2**zoom")
+        shape = (max(0, -((x0 - x1) // size)), max(0, -((y0 - y1) // size)))
+
+        if zoom > 0:
+            # the corner of a root of level zoom is not on the pixel grid
+            if self.level <= zoom:
+                cells = self.get_region(x0, y0, x0 + shape[0] * size, y0 + shape[1] * size)
+                return cells.reshape(shape[0], size, shape[1], size).mean(axis = (1, 3))
+            out = np.zeros(shape)
+            for node, i, j in _blocks(self, x0, y0, x1, y1, zoom):
+                out[(i - x0) >> zoom, (j - y0) >> zoom] = node.population
+            return out / (size * size)
+
+        out = np.zeros(shape, dtype = bool)
+        if self.level < 3:
+            for i in range(x0, x1):
+                for j in range(y0, y1):
+                    out[i - x0, j - y0] = self.get(i, j)
+            return out
+
+        word = _current.store.word
+        for node, i, j in _blocks(self, x0, y0, x1, y1, 3):
+            a0, b0 = max(i, x0), max(j, y0)
+            a1, b1 = min(i + 8, x1), min(j + 8, y1)
+            out[a0 - x0:a1 - x0, b0 - y0:b1 - y0] = _cells8(word(node))[a0 - i:a1 - i, b0 - j:b1 - j]
+        return out
+
+    def live_cells(self):
+        """Yields the coordinates (i, j) of every live cell, skipping empty
+        subtrees"""
+        if self.level < 3:
+            half = (1 << self.level) >> 1
+            for i in range(-half, max(half, 1)):
+                for j in range(-half, max(half, 1)):
+                    if self.get(i, j):
+                        yield (i, j)
+            return
+        word = _current.store.word
+        half = 1 << (self.level - 1)
+        for node, i, j in _blocks(self, -half, -half, half, half, 3):
+            w = word(node)
+            while w:
+                bit = (w & -w).bit_length() - 1
+                w &= w - 1
+                yield (i + 7 - (bit & 7), j + (bit >> 3))
+
+    def bounding_box(self):
+        """Returns (x0, y0, x1, y1) such that all the live cells are in
+        [x0, x1) x [y0, y1), as small as possible, or None when empty"""
+        if self.population == 0:
+            return None
+        return (
+            _extent(self, 0, True ),
+            _extent(self, 1, True ),
+            _extent(self, 0, False) + 1,
+            _extent(self, 1, False) + 1,
+        )
+
+    def population_in(self, x0, y0, x1, y1):
+        """Returns the number of live cells in [x0, x1) x [y0, y1), adding
+        up the cached populations of the nodes inside the rectangle"""
+        children = _current.store.children
+        total = 0
+        half = (1 << self.level) >> 1
+        stack = [(self, -half, -half)]
+        while stack:
+            node, i, j = stack.pop()
+            size = 1 << node.level
+            if node.population == 0 or i >= x1 or j >= y1 or i + size <= x0 or j + size <= y0:
+                continue
+            if x0 <= i and y0 <= j and i + size <= x1 and j + size <= y1:
+                total += node.population
+                continue
+            if node.level == 3:
+                # the rows r of a lane are its bits 7 - r
+                r0, r1 = max(x0 - i, 0), min(x1 - i, 8)
+                lane = ((1 << (r1 - r0)) - 1) << (8 - r1) if r1 > r0 else 0
+                mask = 0
+                for c in range(max(y0 - j, 0), min(y1 - j, 8)):
+                    mask |= lane << (8 * c)
+                total += bin(_current.store.word(node) & mask).count('1')
+                continue
+            h = size >> 1
+            nw, ne, sw, se = children(node)
+            stack.extend(((nw, i, j + h), (ne, i + h, j + h), (sw, i, j), (se, i + h, j)))
+        return total
+
     def __str__(self):
-        s = ''
+        if self.level == 0:
+            return ('* ' if self.population else '. ') + '\n'
         k = self.level - 1
-        for i in range(-2**k, 2**k):
-            for j in range(-2**k, 2**k):
-                if self.get(i,j) == 1:
-                    s += '* '
-                if self.get(i,j) == 0:
-                    s += '. '
-            s += '\n'
-        
-        return s
+        rows = [['. '] * (2 << k) for _ in range(2 << k)]
+        for i, j in self.live_cells():
+            rows[i + 2**k][j + 2**k] = '* '
+        return ''.join(''.join(row) + '\n' for row in rows)
 
     nw = property(lambda self : None)
     ne = property(lambda self : None)
@@ -402,188 +1690,1533 @@ class AbstractNode:
     
     
     
-class CellNode(AbstractNode):
-    def __init__(self, alive):
-        super().__init__()
+def _resolve(node, l):
+    """Returns node.forward(l) if it is memoized or does not need to
+    recurse, otherwise None"""
+    k = node.level
+    if k < 2:
+        return None
+    if l == k - 2:
+        l = None
+    if k == 2:
+        spread, level1 = _current.store.leaves()
+        w = \
+            spread[id(node.nw)] << 10 | spread[id(node.ne)] << 8 | \
+            spread[id(node.sw)] << 2  | spread[id(node.se)]
+        return level1[_current.store.rule.table()[w]]
 
-        self._alive = bool(alive)
+    key = k - 2 if l is None else l
+    value = _current.store.recall(node, key)
+    if value is not None:
+        return value
+    if node.population == 0:
+        return _current.store.zero(k - 1)
+    if k < 5 or (k == 5 and l is not None):
+        return _current.store.memoize(node, key, forward_block(node, 1 << key))
+    return None
 
-    level      = property(lambda self : 0)
-    population = property(lambda self : int(self._alive))
-    alive      = property(lambda self : self._alive)
-    
+def _step(node, l, check = None):
+    """Returns node.forward(l) from the engine suiting the current store:
+    forward_iterative() if the store is iterative or to honor check, the
+    recursive forward() otherwise"""
+    if check is None and not _current.store.iterative:
+        return node.forward(l)
+    return node.forward_iterative(l, check)
 
-class Node(AbstractNode):
-    def __init__(self, nw, ne, sw, se):
-        super().__init__()
-
-        self._level      = 1 + nw.level
-        self._population =  nw.population + ne.population + sw.population + se.population
-        self._nw = nw
-        self._ne = ne
-        self._sw = sw
-        self._se = se
-
-    level = property(lambda self : self._level)
-    population = property(lambda self : self._population)
-
-    nw = property(lambda self : self._nw)
-    ne = property(lambda self : self._ne)
-    sw = property(lambda self : self._sw)
-    se = property(lambda self : self._se)
-    
+def _expand(node, l):
+    """Returns the subtasks of a frame starting the computation of
+    node.forward(l), and the step they are run with"""
+    mknode, children = _current.store.node, _current.store.children
+    nw, ne, sw, se = children(node)
+    nwnw, nwne, nwsw, nwse = children(nw)
+    nenw, nene, nesw, nese = children(ne)
+    swnw, swne, swsw, swse = children(sw)
+    senw, sene, sesw, sese = children(se)
 
-class HashLifeUniverse(Universe):
-    def __init__(self, *args):
-        if len(args) == 1:
-            self._root = args[0]
-        else:
-            self._root = HashLifeUniverse.load(*args)
+    if l is None:
+        return [
+            nw, ne, sw, se,
+            mknode(nwse, nesw, swne, senw),
+            mknode(nwne, nenw, nwse, nesw),
+            mknode(nwsw, nwse, swnw, swne),
+            mknode(swne, senw, swse, sesw),
+            mknode(nesw, nese, senw, sene),
+        ], None
 
-        self._generation = 0
+    def center(q):
+        qnw, qne, qsw, qse = children(q)
+        return mknode(children(qnw)[3], children(qne)[2], children(qsw)[1], children(qse)[0])
 
-    @staticmethod
-    def load(n, m, cells):
-        level = math.ceil(math.log(max(1, n, m), 2))
+    RNW = center(nw)
+    RNE = center(ne)
+    RSW = center(sw)
+    RSE = center(se)
+    nwse, nesw, swne, senw = children(nwse), children(nesw), children(swne), children(senw)
+    nwne, nenw, nwsw, swnw = children(nwne), children(nenw), children(nwsw), children(swnw)
+    swse, sesw, nese, sene = children(swse), children(sesw), children(nese), children(sene)
+    RCC = mknode(nwse[3], nesw[2], swne[1], senw[0])
+    RTC = mknode(nwne[3], nenw[2], nwse[1], nesw[0])
+    RCL = mknode(nwsw[3], nwse[2], swnw[1], swne[0])
+    RBC = mknode(swne[3], senw[2], swse[1], sesw[0])
+    RCR = mknode(nesw[3], nese[2], senw[1], sene[0])
+    return [
+        mknode(RNW, RTC, RCL, RCC),
+        mknode(RTC, RNE, RCC, RCR),
+        mknode(RCL, RCC, RSW, RBC),
+        mknode(RCC, RCR, RBC, RSE),
+    ], l
 
-        mkcell = getattr(AbstractNode, 'cell', CellNode)
-        mknode = getattr(AbstractNode, 'node', Node    )
+def _run(root, l, check = None):
+    if l == root.level - 2:
+        l = None
+    store = _current.store
+    recall, memoize, mknode, children = store.recall, store.memoize, store.node, store.children
+    zero = store.zero
+    spread, level1 = store.leaves()
+    table = store.rule.table()
+    # under profile(), the profiles of the store, those timing the frames
+    # and the start of every frame
+    profiled = store._profiled
+    timed = [stats for stats, timing in profiled or () if timing]
+    starts = [time.perf_counter()] if timed else None
 
-        def get(i, j):
-            i, j = i + n // 2, j + m // 2
-            return \
-                i in range(n) and \
-                j in range(m) and \
-                cells[i][j]
-                
-        def create(i, j, level):
-            if level == 0:
-                return mkcell(get (i, j))
+    subtasks, sub = _expand(root, l)
+    stack = [[root, l, 0, subtasks, [], sub]]
+    frame = stack[-1]
 
-            noffset = 1 if level < 2 else 1 << (level - 2)
-            poffset = 0 if level < 2 else 1 << (level - 2)
+    while True:
+        node, l, stage, subtasks, results, sub = frame
+        append = results.append
 
-            nw = create(i-noffset, j+poffset, level - 1)
-            sw = create(i-noffset, j-noffset, level - 1)
-            ne = create(i+poffset, j+poffset, level - 1)
-            se = create(i+poffset, j-noffset, level - 1)
+        # resolve the pending subtasks as _resolve() does, descending into
+        # the first one that needs a frame of its own
+        child = None
+        for task in subtasks[len(results):]:
+            k = task.level
+            if profiled is not None:
+                _count_forward(profiled, k)
+            if k == 2:
+                nw, ne, sw, se = children(task)
+                append(level1[table[
+                    spread[id(nw)] << 10 | spread[id(ne)] << 8 |
+                    spread[id(sw)] << 2  | spread[id(se)]]])
+                continue
+            key = k - 2 if sub is None or sub == k - 2 else sub
+            value = recall(task, key)
+            if value is None:
+                if task.population == 0:
+                    value = zero(k - 1)
+                elif k < 5 or (k == 5 and key < 3):
+                    value = memoize(task, key, forward_block(task, 1 << key))
+                else:
+                    child = task
+                    break
+            append(value)
 
-            return mknode(nw=nw, ne=ne, sw=sw, se=se)
-                
-        return create(0, 0, level)
+        if child is not None:
+            if check is not None:
+                check()
+            childl = None if key == k - 2 else key
+            childsubtasks, childsub = _expand(child, childl)
+            frame = [child, childl, 0, childsubtasks, [], childsub]
+            stack.append(frame)
+            if timed:
+                starts.append(time.perf_counter())
+            continue
 
-    def get(self, i, j):
-        node = self.root
-        k = node.level
-        
-        if k == 0:
-            if i == 0 and j == 0:
-                return node.population
-            else:
-                return False
-        
-        l = 2**(k-1)
-        if i >= l or i < -l or j >= l or j < -l:
-            return False
-        
-        while k > 1:
+        if l is None and stage == 0:
+            RNW, RNE, RSW, RSE, RCC, RTC, RCL, RBC, RCR = results
+            frame[2] = 1
+            frame[3] = [
+                mknode(RNW, RTC, RCL, RCC),
+                mknode(RTC, RNE, RCC, RCR),
+                mknode(RCL, RCC, RSW, RBC),
+                mknode(RCC, RCR, RBC, RSE),
+            ]
+            # the same list collects the second round of results
+            results.clear()
+            continue
 
-            if i >= 0 and j >= 0:
-                node = node.ne
-                i -= 2**(k-2)
-                j -= 2**(k-2)
-                
-            elif i >= 0 and j < 0:
-                node = node.se
-                i -= 2**(k-2)
-                j += 2**(k-2)             
+        value = memoize(node, node.level - 2 if l is None else l, mknode(*results))
+        stack.pop()
+        if timed:
+            elapsed = time.perf_counter() - starts.pop()
+            for stats in timed:
+                stats.forward_time[node.level] += elapsed
+        if not stack:
+            return value
+        frame = stack[-1]
+        frame[4].append(value)
 
-            elif i < 0 and j < 0:
-                node = node.sw
-                i += 2**(k-2)
-                j += 2**(k-2)          
+def _walk(roots, leaf = 0, memo = False):
+    """Yields every distinct node reachable from roots, children first.
+    Nodes of level leaf are not descended into; with memo, memoized
+    forward() results are followed as well."""
+    children = _current.store.children
+    # keeps the nodes alive so that their ids stay unique
+    seen = dict()
+    stack = list(roots)
+    while stack:
+        node = stack[-1]
+        if id(node) in seen:
+            stack.pop()
+            continue
+        pending = []
+        if node.level > 0 and node.level != leaf:
+            pending.extend(q for q in children(node) if id(q) not in seen)
+        if memo and node.cache:
+            pending.extend(r for r in node.cache.values() if id(r) not in seen)
+        if pending:
+            stack.extend(pending)
+            continue
+        stack.pop()
+        seen[id(node)] = node
+        yield node
+
+# the last two indices of a level 3 record, whose first two are its word
+LEAF_RECORD = (1 << 32) - 1
+
+def _records(roots, memo = False):
+    """Yields the distinct nodes below roots, children first, with their
+    records of four 32-bit integers as pack() writes them, or None for
+    the two cells"""
+    children, word = _current.store.children, _current.store.word
+    index = dict()
+    count = 0
+    for node in _walk(roots, leaf = 3, memo = memo):
+        if node.level == 0:
+            index[id(node)] = int(node.population)
+            yield node, None, index
+            continue
+        index[id(node)] = count + 2
+        count += 1
+        if node.level == 3:
+            w = word(node)
+            yield node, (w & 0xFFFFFFFF, w >> 32, LEAF_RECORD, LEAF_RECORD), index
+        else:
+            yield node, [index[id(q)] for q in children(node)], index
+
+def pack(node):
+    """Serializes the DAG below node as an array of 32-bit indices.
+
+    The first index is the root, then every distinct node is written once,
+    children before parents, as a record of four indices: those of its
+    nw, ne, sw and se children or, for a level 3 node, its 8x8 word in
+    two halves, low first, and twice LEAF_RECORD. Indices 0 and 1 are the
+    dead and the alive cell, the n-th node written has index n + 2.
+    """
+    out = array.array('I', [0])
+    for top, record, index in _records([node]):
+        if record is not None:
+            out.extend(record)
+
+    out[0] = index[id(node)]
+    return out.tobytes()
+
+def _rebuild(store, nodes, records):
+    """Appends to nodes the nodes of store read from records, a flat
+    sequence of pack() records"""
+    mknode, leaf = store.node, store.leaf
+    for i in range(0, len(records), 4):
+        nw, ne, sw, se = records[i:i+4]
+        if sw == LEAF_RECORD:
+            nodes.append(leaf(nw | ne << 32))
+        else:
+            nodes.append(mknode(nodes[nw], nodes[ne], nodes[sw], nodes[se]))
+
+# magic, version, root, node count, memo count, size of the integers
+# following the header (the generation and the offset)
+CHECKPOINT_HEADER  = '<4sIQQQQ'
+CHECKPOINT_MAGIC   = b'HLCK'
+CHECKPOINT_VERSION = 4
+
+def _aligned(size):
+    return (size + 7) // 8 * 8
+
+def _encode(x):
+    """Packs an integer of any size as its byte length and its bytes"""
+    data = x.to_bytes(x.bit_length() // 8 + 1, 'little', signed = True)
+    return struct.pack('<I', len(data)) + data
+
+def _decode(data, count):
+    values = []
+    pos = 0
+    for _ in range(count):
+        size, = struct.unpack_from('<I', data, pos)
+        values.append(int.from_bytes(data[pos + 4:pos + 4 + size], 'little', signed = True))
+        pos += 4 + size
+    return values
+
+def unpack(data):
+    """Rebuilds in the current store a node serialized by pack()"""
+    words = array.array('I')
+    words.frombytes(data)
+    nodes = [_current.store.cell(0), _current.store.cell(1)]
+    _rebuild(_current.store, nodes, words[1:])
+    return nodes[words[0]]
+
+# roots below this level (minus the parallel depth) are not worth shipping
+PARALLEL_MIN_LEVEL = 8
+
+def forward_parallel(node, l, executor, depth = 1):
+    """Same as node.forward(l), computing the top depth levels here and
+    the subproblems below them in executor.
+
+    The computation is a tree of plans (generators) that yield the
+    (node, l) pairs they need and receive the results. All the plans of a
+    level run side by side, so every wave of independent subproblems is
+    submitted at once. Subtrees travel as pack() payloads and results are
+    memoized in the local store."""
+    plan = _plan(node, l, depth)
+    try:
+        requests = next(plan)
+        while True:
+            requests = plan.send(_dispatch(requests, executor))
+    except StopIteration as stop:
+        return stop.value
+
+def _plan(node, l, depth):
+    k = node.level
+    if l == k - 2:
+        l = None
+    value = _resolve(node, l)
+    if value is not None:
+        return value
+    if depth == 0:
+        results = yield [(node, l)]
+        return results[0]
+
+    mknode = _current.store.node
+    subtasks, sub = _expand(node, l)
+    results = yield from _gather([_plan(task, sub, depth - 1) for task in subtasks])
+    if l is None:
+        RNW, RNE, RSW, RSE, RCC, RTC, RCL, RBC, RCR = results
+        subtasks = [
+            mknode(RNW, RTC, RCL, RCC),
+            mknode(RTC, RNE, RCC, RCR),
+            mknode(RCL, RCC, RSW, RBC),
+            mknode(RCC, RCR, RBC, RSE),
+        ]
+        results = yield from _gather([_plan(task, None, depth - 1) for task in subtasks])
+    return _current.store.memoize(node, k - 2 if l is None else l, mknode(*results))
+
+def _gather(plans):
+    """Runs plans side by side, yielding the union of their requests"""
+    results = [None] * len(plans)
+    pending = dict()
+    for i, plan in enumerate(plans):
+        try:
+            pending[i] = next(plan)
+        except StopIteration as stop:
+            results[i] = stop.value
+
+    while pending:
+        answers = yield [request for requests in pending.values() for request in requests]
+        pos = 0
+        waiting = dict()
+        for i, requests in pending.items():
+            try:
+                waiting[i] = plans[i].send(answers[pos:pos + len(requests)])
+            except StopIteration as stop:
+                results[i] = stop.value
+            pos += len(requests)
+        pending = waiting
+    return results
+
+def _dispatch(requests, executor):
+    jobs = dict()
+    for node, l in requests:
+        jobs.setdefault((id(node), l), (node, l))
+    code = _current.store.rule.code
+    payloads = [(pack(node), l, code) for node, l in jobs.values()]
+
+    answers = dict()
+    for key, data in zip(jobs, executor.map(_forward_packed, payloads)):
+        node, l = jobs[key]
+        k = node.level
+        answers[key] = _current.store.memoize(node, k - 2 if l is None else l, unpack(data))
+    return [answers[id(node), l] for node, l in requests]
+
+def _forward_packed(payload):
+    """Worker side of forward_parallel()"""
+    data, l, code = payload
+    with use_store(store_for(Rule.from_code(code))) as store:
+        node = unpack(data)
+        result = _step(node, l)
+        data = pack(result)
+        store.maybe_collect((node, result))
+    return data
+
+class CellNode(AbstractNode):
+    __slots__ = ('alive', 'population', '_hash')
+
+    level = 0
+
+    def __init__(self, alive):
+        self.alive = bool(alive)
+        self.population = int(self.alive)
+        self._hash = None
+    
+
+class Node(AbstractNode):
+    # _next is the memoized natural result, 2**(level-2) generations on
+    __slots__ = ('level', 'population', 'nw', 'ne', 'sw', 'se', '_hash', '_next')
+
+    def __init__(self, nw, ne, sw, se):
+        self.level = nw.level + 1
+        self.population = nw.population + ne.population + sw.population + se.population
+        self.nw = nw
+        self.ne = ne
+        self.sw = sw
+        self.se = se
+        self._hash = None
+        self._next = None
+    
+
+class LeafNode(AbstractNode):
+    """Node of level 3 holding its 8x8 cells in a 64-bit word.
+
+    NodeStore builds every level 3 node as a leaf, so the tree has no
+    nodes below level 3 and the bottom of forward() works on words. The
+    quadrants are still available, as level 2 nodes built on demand.
+    """
+
+    __slots__ = ('_word', 'population', '_next')
+
+    level = 3
+
+    def __init__(self, word):
+        self._word = word
+        self.population = bin(word).count('1')
+        self._next = None
+
+    def __hash__(self):
+        return hash(self._word)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, LeafNode):
+            return False
+        return self._word == other._word
+
+    word = property(lambda self : self._word)
+
+    nw = property(lambda self : _level2(_gather4(self._word >> 36)))
+    ne = property(lambda self : _level2(_gather4(self._word >> 32)))
+    sw = property(lambda self : _level2(_gather4(self._word >> 4)))
+    se = property(lambda self : _level2(_gather4(self._word)))
+
+
+class TableNode(AbstractNode):
+    """Handle on a row of a TableStore.
+
+    Handles are interned per row while they are referenced, so identity
+    comparisons between children keep working, but the quadtree itself
+    lives in the flat arrays of the store.
+    """
+
+    __slots__ = ('_store', '_index', '__weakref__')
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def __hash__(self):
+        return hash(self._index)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, TableNode):
+            return False
+        return self._index == other._index and self._store is other._store
+
+    @property
+    def cache(self):
+        return self._store.memos(self._index)
+
+    level      = property(lambda self : self._store._level[self._index])
+    population = property(lambda self : self._store.population(self._index))
+    alive      = property(lambda self : self._index == 1)
+
+    nw = property(lambda self : self._store.children(self)[0])
+    ne = property(lambda self : self._store.children(self)[1])
+    sw = property(lambda self : self._store.children(self)[2])
+    se = property(lambda self : self._store.children(self)[3])
+
+
+class TableStore(NodeStore):
+    """Node store keeping the quadtree in flat arrays.
+
+    Each node is a row: four child indices, its level, its population, the
+    index of its memoized 2**(k-2) result and its last use. Level 3 nodes
+    are leaves as in NodeStore, rows holding their 8x8 word in place of the
+    children, and the rows of level 1 and 2 only exist while a leaf is
+    looked into. Rows 0 and 1 are the dead and the alive cell. The rows are
+    canonicalized by an open-addressed index, an array of row indices
+    probed linearly from the hash of the four children and rebuilt when it
+    is half full or after a sweep. Fixed-step results live in a sparse
+    dict, at most max_steps of them, dropped oldest first. Python objects
+    (TableNode) only exist for the rows currently referenced from Python.
+    Freed rows are recycled through a free list.
+
+    A row costs under 60 bytes, a NodeStore node about 270: a 128x128 soup
+    run 300 generations without collection takes 2.0 MB against 9.5 MB
+    for the same 35,000 nodes, as traced by tracemalloc. Stepping is about
+    twice as slow, acorn runs 1,900 generations per second against 4,200.
+    """
+
+    FREE = 255
+    BIG  = (1 << 64) - 1
+    # the sw and se columns of a leaf, never a row index
+    LEAF = (1 << 32) - 1
+
+    iterative = True
 
+    def __init__(self, max_bytes = None, rule = LIFE, max_steps = None):
+        super().__init__(max_bytes, rule, max_steps)
+        self._nw     = array.array('I', [0, 0])
+        self._ne     = array.array('I', [0, 0])
+        self._sw     = array.array('I', [0, 0])
+        self._se     = array.array('I', [0, 0])
+        self._level  = array.array('B', [0, 0])
+        self._pop    = array.array('Q', [0, 1])
+        self._result = array.array('i', [-1, -1])
+        self._stamp  = array.array('I', [0, 0])
+        # populations that do not fit in 64 bits
+        self._bigpop = dict()
+        # the index: rows by the hash of their children, -1 when empty;
+        # its mask is its length minus one
+        self._slots = array.array('i', [-1]) * 1024
+        self._count = 0
+        # fixed-step results, {index << 8 | l: result index}, oldest first
+        self._steps = OrderedDict()
+        self._memo_entries = 0
+        self._free = []
+        self._clock = 0
+        # handles, {index: weakref.ref}, pruned of the dead ones whenever
+        # they have doubled
+        self._handles = dict()
+        self._handle_limit = 1024
+
+    def handle(self, index):
+        handles = self._handles
+        ref = handles.get(index)
+        if ref is not None:
+            node = ref()
+            if node is not None:
+                return node
+        node = TableNode(self, index)
+        handles[index] = weakref.ref(node)
+        if len(handles) > self._handle_limit:
+            self._prune()
+        return node
+
+    def _prune(self):
+        with self._lock:
+            handles = self._handles
+            for index in [index for index, ref in handles.items() if ref() is None]:
+                # another thread may have handed out the row again meanwhile
+                ref = handles.get(index)
+                if ref is not None and ref() is None:
+                    del handles[index]
+            self._handle_limit = max(1024, 2 * len(handles))
+
+    def population(self, index):
+        pop = self._pop[index]
+        if pop == TableStore.BIG:
+            return self._bigpop[index]
+        return pop
+
+    def cell(self, alive):
+        return self.handle(1 if alive else 0)
+
+    def children(self, node):
+        """Returns the (nw, ne, sw, se) handles of a node; the quadrants of
+        a leaf are built from its word"""
+        index = node._index
+        if self._level[index] == 3:
+            level1, node = self.leaves()[1], self.node
+            return tuple(
+                node(
+                    level1[code >> 10 & 0x33], level1[code >> 8 & 0x33],
+                    level1[code >> 2  & 0x33], level1[code       & 0x33])
+                for code in _quarters8(self._nw[index] | self._ne[index] << 32))
+        handle = self.handle
+        return \
+            handle(self._nw[index]), handle(self._ne[index]), \
+            handle(self._sw[index]), handle(self._se[index])
+
+    def _find(self, a, b, c, d):
+        """Returns the row of children a, b, c, d, or -1 and the empty slot
+        of the index it would take"""
+        slots = self._slots
+        mask = len(slots) - 1
+        nw, ne, sw, se = self._nw, self._ne, self._sw, self._se
+        h = hash((a, b, c, d)) & mask
+        while True:
+            index = slots[h]
+            if index < 0 or (nw[index] == a and ne[index] == b and sw[index] == c and se[index] == d):
+                return index, h
+            h = (h + 1) & mask
+
+    def _add(self, a, b, c, d, level, pop):
+        """Returns the row of children a, b, c, d, adding it if needed"""
+        with self._lock:
+            # another thread may have added it meanwhile
+            index, h = self._find(a, b, c, d)
+            if index < 0:
+                index = self._new_row(a, b, c, d, level, pop)
+                self._count += 1
+                if 2 * self._count > len(self._slots):
+                    self._reindex()
+                else:
+                    self._slots[h] = index
+        return index
+
+    def _reindex(self):
+        """Rebuilds the index from the rows, at most a quarter full"""
+        size = 1 << max(10, (4 * self._count).bit_length() - 1)
+        slots = array.array('i', [-1]) * size
+        mask = size - 1
+        nw, ne, sw, se, level = self._nw, self._ne, self._sw, self._se, self._level
+        for index in range(2, len(level)):
+            if level[index] != TableStore.FREE:
+                h = hash((nw[index], ne[index], sw[index], se[index])) & mask
+                while slots[h] >= 0:
+                    h = (h + 1) & mask
+                slots[h] = index
+        self._slots = slots
+
+    def node(self, nw, ne, sw, se):
+        a, b, c, d = nw._index, ne._index, sw._index, se._index
+        level = self._level[a]
+        # level 3 nodes are leaves
+        if level == 2:
+            return self.leaf(_word8(*(self._code2(q) for q in (nw, ne, sw, se))))
+        index = self._find(a, b, c, d)[0]
+        if index < 0:
+            pop = \
+                self.population(a) + self.population(b) + \
+                self.population(c) + self.population(d)
+            index = self._add(a, b, c, d, level + 1, pop)
+        return self.handle(index)
+
+    def leaf(self, word):
+        """Returns the leaf row of an 8x8 word, which it holds in its nw
+        (low half) and ne (high half) columns"""
+        a, b = word & 0xFFFFFFFF, word >> 32
+        index = self._find(a, b, TableStore.LEAF, TableStore.LEAF)[0]
+        if index < 0:
+            index = self._add(a, b, TableStore.LEAF, TableStore.LEAF, 3, bin(word).count('1'))
+        return self.handle(index)
+
+    def word(self, node):
+        index = node._index
+        return self._nw[index] | self._ne[index] << 32
+
+    def canon(self, node):
+        """Imports a node of any backend into this store"""
+        if isinstance(node, TableNode):
+            if node._store is self:
+                return node
+            if node.level == 3:
+                return self.leaf(node._store.word(node))
+        elif isinstance(node, LeafNode):
+            return self.leaf(node.word)
+        if node.level == 0:
+            return self.cell(node.population)
+        return self.node(
+            self.canon(node.nw), self.canon(node.ne),
+            self.canon(node.sw), self.canon(node.se))
+
+    def _new_row(self, a, b, c, d, level, pop):
+        big = pop >= TableStore.BIG
+        if self._free:
+            index = self._free.pop()
+            self._nw[index] = a
+            self._ne[index] = b
+            self._sw[index] = c
+            self._se[index] = d
+            self._level[index] = level
+            self._pop[index] = TableStore.BIG if big else pop
+            self._result[index] = -1
+            self._stamp[index] = 0
+        else:
+            index = len(self._level)
+            self._nw.append(a)
+            self._ne.append(b)
+            self._sw.append(c)
+            self._se.append(d)
+            self._level.append(level)
+            self._pop.append(TableStore.BIG if big else pop)
+            self._result.append(-1)
+            self._stamp.append(0)
+        if big:
+            self._bigpop[index] = pop
+        return index
+
+    def recall(self, node, l):
+        index = node._index
+        if l == self._level[index] - 2:
+            value = self._result[index]
+        else:
+            value = self._steps.get(index << 8 | l, -1)
+        if value < 0:
+            return None
+        if self.max_bytes is not None:
+            self._clock += 1
+            self._stamp[index] = self._clock & 0xFFFFFFFF
+        return self.handle(value)
+
+    def memoize(self, node, l, result):
+        index = node._index
+        with self._lock:
+            if l == self._level[index] - 2:
+                if self._result[index] < 0:
+                    self._memo_entries += 1
+                self._result[index] = result._index
+            elif self.max_steps != 0:
+                key = index << 8 | l
+                if key not in self._steps:
+                    self._memo_entries += 1
+                    if self.max_steps is not None and len(self._steps) >= self.max_steps:
+                        self._steps.popitem(last = False)
+                        self._memo_entries -= 1
+                self._steps[key] = result._index
+        if self.max_bytes is not None:
+            self._clock += 1
+            self._stamp[index] = self._clock & 0xFFFFFFFF
+        return result
+
+    def memos(self, index):
+        """Returns the memoized results of a row as {l: node}, or None"""
+        memos = dict()
+        if self._result[index] >= 0:
+            memos[self._level[index] - 2] = self.handle(self._result[index])
+        for key, value in self._steps.items():
+            if key >> 8 == index:
+                memos[key & 0xFF] = self.handle(value)
+        return memos or None
+
+    def drop_steps(self, l = None):
+        with self._lock:
+            for key in [key for key in self._steps if l is None or key & 0xFF == l]:
+                del self._steps[key]
+                self._memo_entries -= 1
+
+    def memo_stats(self):
+        steps = Counter(key & 0xFF for key in self._steps)
+        return {
+            'natural': self._memo_entries - len(self._steps),
+            'steps': dict(steps),
+            'bytes': self.memo_bytes,
+        }
+
+    def _owners(self):
+        owners = {key >> 8 for key in self._steps}
+        owners.update(i for i, r in enumerate(self._result) if r >= 0)
+        return owners
+
+    def evict(self, count):
+        victims = heapq.nsmallest(count, self._owners(), key = self._stamp.__getitem__)
+        victims = set(victims)
+        for index in victims:
+            if self._result[index] >= 0:
+                self._result[index] = -1
+                self._memo_entries -= 1
+        for key in [key for key in self._steps if key >> 8 in victims]:
+            del self._steps[key]
+            self._memo_entries -= 1
+
+    def _sweep(self, roots):
+        marked = bytearray(len(self._level))
+        marked[0] = marked[1] = 1
+        steps = dict()
+        for key, value in self._steps.items():
+            steps.setdefault(key >> 8, []).append(value)
+
+        stack = [node for u in self._universes for node in u.roots()]
+        stack.extend(self._pinned.values())
+        stack.extend(roots)
+        stack = [self.canon(node)._index for node in stack]
+        stack.extend(index for index, ref in list(self._handles.items()) if ref() is not None)
+        while stack:
+            index = stack.pop()
+            if marked[index]:
+                continue
+            marked[index] = 1
+            # the children of a leaf are its word
+            if self._level[index] != 3:
+                stack.extend((self._nw[index], self._ne[index], self._sw[index], self._se[index]))
+            if self._result[index] >= 0:
+                stack.append(self._result[index])
+            stack.extend(steps.get(index, ()))
+
+        freed = 0
+        for index in range(2, len(marked)):
+            if marked[index] or self._level[index] == TableStore.FREE:
+                continue
+            if self._result[index] >= 0:
+                self._result[index] = -1
+                self._memo_entries -= 1
+            self._level[index] = TableStore.FREE
+            self._bigpop.pop(index, None)
+            self._free.append(index)
+            freed += 1
+        for key in [key for key in self._steps if not marked[key >> 8]]:
+            del self._steps[key]
+            self._memo_entries -= 1
+        if freed:
+            self._count -= freed
+            self._reindex()
+        return freed
+
+    @property
+    def node_count(self):
+        return self._count + 2
+
+    @property
+    def memo_count(self):
+        return self._memo_entries
+
+    @property
+    def memo_nodes(self):
+        return len(self._owners())
+
+    @property
+    def memo_bytes(self):
+        # the natural results are a column of the rows
+        return \
+            len(self._result) * self._result.itemsize + \
+            sys.getsizeof(self._steps) + \
+            len(self._steps) * 2 * sys.getsizeof(1 << 40)
+
+    @property
+    def nbytes(self):
+        columns = (
+            self._nw, self._ne, self._sw, self._se,
+            self._level, self._pop, self._result, self._stamp)
+        return \
+            sum(len(c) * c.itemsize for c in columns) + \
+            len(self._slots) * self._slots.itemsize + \
+            sys.getsizeof(self._steps) + \
+            len(self._steps) * 2 * sys.getsizeof(1 << 40)
+
+    def __len__(self):
+        return self.node_count
+
+    
+class HashLifeUniverse(Universe):
+    """Universe stepped by HashLife, from a root node or from the
+    arguments of load(). With a rule, the universe lives in store_for(rule)
+    and switches to it whenever it works on its nodes; without one it
+    lives in the current store and follows its rule."""
+
+    def __init__(self, *args, rule = None):
+        self._store = _current.store if rule is None else store_for(rule)
+        if len(args) == 1:
+            self._root = args[0]
+        else:
+            with use_store(self._store):
+                self._root = HashLifeUniverse.load(*args)
+
+        self._generation = 0
+        self._store.track(self)
+        self._executor = None
+        self._depth = 1
+        self._mode = 'jump'
+        self._step = None
+        # coordinates of the center of the root
+        self._offset = (0, 0)
+        # number of steps taken per exponent l
+        self._used = dict()
+        # states recorded by watch(), canonical node: (generation, position)
+        self._history = None
+        self._cycle = None
+
+    @staticmethod
+    def load(n, m, cells):
+        level = math.ceil(math.log(max(1, n, m), 2))
+
+        if np is not None and isinstance(cells, np.ndarray):
+            return HashLifeUniverse.load_array(cells[:n, :m], level)
+
+        live = (
+            (i - n // 2, j - m // 2)
+            for i in range(n) for j in range(m) if cells[i][j])
+        return HashLifeUniverse.load_cells(live, level)
+
+    @staticmethod
+    def load_cells(cells, level = 0):
+        """Builds bottom-up a root of at least the given level holding the
+        live cells (i, j), in the coordinates of get(). Only the 8x8 blocks
+        containing a live cell are ever visited."""
+        words = dict()
+        # smallest level whose square contains all the cells
+        need = 0
+        for i, j in cells:
+            key = (i >> 3, j >> 3)
+            words[key] = words.get(key, 0) | 1 << (8 * (j & 7) + 7 - (i & 7))
+            if i or j:
+                # ~x == -x - 1, the distance to the border for negative coordinates
+                need = max(need, 1 + max(
+                    (i if i >= 0 else ~i).bit_length(),
+                    (j if j >= 0 else ~j).bit_length()))
+
+        # leaves are aligned on the 8x8 grid below a node of level 4
+        top = max(level, need, 4)
+        shift = 1 << (top - 4)
+        nodes = dict(
+            ((u + shift, v + shift), _current.store.leaf(word))
+            for (u, v), word in words.items())
+        mknode = _current.store.node
+
+        k = 3
+        while k < top:
+            zero = _current.store.zero(k)
+            get = nodes.get
+            nodes = dict(
+                ((u, v), mknode(
+                    get((2*u, 2*v+1), zero), get((2*u+1, 2*v+1), zero),
+                    get((2*u, 2*v  ), zero), get((2*u+1, 2*v  ), zero)))
+                for u, v in {(u >> 1, v >> 1) for u, v in nodes})
+            k += 1
+
+        root = nodes.get((0, 0), _current.store.zero(top))
+        return _shrink(root, max(level, need))
+
+    @staticmethod
+    def load_array(cells, level = 0):
+        """Same as load() for a 2d NumPy array, building every level of
+        the tree with array operations: each distinct 8x8 block and each
+        distinct quadruple of children is turned into a node only once."""
+        if np is None:
+            raise ImportError("load_array requires numpy")
+        cells = np.asarray(cells, dtype = bool)
+        n, m = cells.shape
+        level = max(level, math.ceil(math.log(max(1, n, m), 2)))
+        top = max(level, 4)
+        half = 1 << (top - 1)
+        # position of cells[0, 0] from the corner of the root
+        u0, v0 = half - n // 2, half - m // 2
+
+        pu, pv = u0 % 8, v0 % 8
+        # the rows packed 8 cells a byte, the bit c of the byte b holding
+        # the column 8b + c - pv, so that a byte is a row of an 8x8 block
+        packed = np.packbits(cells, axis = 1, bitorder = 'little')
+        width = packed.shape[1]
+        grid = np.zeros((-(-(pu + n) // 8) * 8, -(-(pv + m) // 8)), dtype = np.uint8)
+        grid[pu:pu + n, :width] = packed << np.uint8(pv)
+        if pv:
+            grid[pu:pu + n, 1:] |= (packed >> np.uint8(8 - pv))[:, :grid.shape[1] - 1]
+        del packed
+
+        # spread[b] has the bit c of b at 8c, the row 0 of a column c
+        spread = np.zeros(256, dtype = np.uint64)
+        for c in range(8):
+            spread |= (np.arange(256, dtype = np.uint64) >> np.uint64(c) & np.uint64(1)) << np.uint64(8 * c)
+        blocks = grid.reshape(grid.shape[0] // 8, 8, grid.shape[1])
+        words = np.zeros((blocks.shape[0], blocks.shape[2]), dtype = np.uint64)
+        for r in range(8):
+            words |= spread[blocks[:, r, :]] << np.uint64(7 - r)
+        del grid, blocks
+
+        # the empty block is always id 0, so padding with 0 pads with zero
+        uniq, ids = np.unique(np.append(words.ravel(), np.uint64(0)), return_inverse = True)
+        ids = ids.reshape(-1)[:-1].reshape(words.shape)
+        nodes = [_current.store.leaf(int(word)) for word in uniq]
+        origin = (u0 // 8, v0 // 8)
+        mknode = _current.store.node
+
+        k = 3
+        while k < top:
+            (ou, ov), (h, w) = origin, ids.shape
+            ids = np.pad(ids, ((ou & 1, (ou + h) & 1), (ov & 1, (ov + w) & 1)))
+            origin = (ou >> 1, ov >> 1)
+            quads = np.stack([
+                ids[0::2, 1::2], ids[1::2, 1::2],
+                ids[0::2, 0::2], ids[1::2, 0::2]], axis = -1)
+            shape = quads.shape[:2]
+            quads = np.vstack([np.zeros((1, 4), dtype = quads.dtype), quads.reshape(-1, 4)])
+            uniq, inverse = np.unique(quads, axis = 0, return_inverse = True)
+            ids = inverse.reshape(-1)[1:].reshape(shape)
+            nodes = [
+                mknode(nodes[a], nodes[b], nodes[c], nodes[d])
+                for a, b, c, d in uniq.tolist()]
+            k += 1
+
+        return _shrink(nodes[ids[0, 0]], level)
+
+    @staticmethod
+    def load_rle(lines):
+        """Builds a root from a pattern in RLE format, given as an iterable
+        of lines (e.g. an open file) that is read lazily. The pattern is
+        centered as load() centers an x by y cells matrix."""
+        lines = iter(lines)
+        n = m = 0
+        for line in lines:
+            stripped = line.strip()
+            if not stripped or stripped.startswith('#'):
+                continue
+            if stripped.startswith('x'):
+                header = rle_header(stripped)
+                n, m = header.get('y', 0), header.get('x', 0)
             else:
-                node = node.nw
-                i += 2**(k-2)
-                j -= 2**(k-2)          
-                
-                
-            k = node.level
-        
-        if i == 0 and j == 0:
-            return node.ne.population
-        elif i == 0 and j == -1:
-            return node.se.population
-        elif i == -1 and j == -1:
-            return node.sw.population
+                lines = itertools.chain([line], lines)
+            break
+
+        live = ((i - n // 2, j - m // 2) for i, j in read_rle(lines))
+        return HashLifeUniverse.load_cells(live, math.ceil(math.log(max(1, n, m), 2)))
+
+    @staticmethod
+    def load_macrocell(lines):
+        """Builds a root from a pattern in Macrocell (.mc) format, given as
+        an iterable of lines that is read lazily. The center of the
+        Macrocell root is the origin. The #R rule line is ignored, see
+        restore()."""
+        return HashLifeUniverse._read_macrocell(lines)[0]
+
+    @staticmethod
+    def _read_macrocell(lines):
+        """Returns the root, the generation, the offset and the rule of a
+        Macrocell file, building the root in the current store"""
+        mknode = _current.store.node
+        generation = 0
+        offset = (0, 0)
+        rule = LIFE
+        # Macrocell nodes are numbered from 1
+        nodes = [None]
+        for line in lines:
+            line = line.strip()
+            if line.startswith('#R'):
+                rule = Rule.parse(line[2:].strip())
+                continue
+            if line.startswith('#G'):
+                generation = int(line[2:])
+                continue
+            if line.startswith('#O'):
+                offset = tuple(int(x) for x in line[2:].split())
+                continue
+            if not line or line[0] in '#[':
+                continue
+            if line[0] in '.*$':
+                rows = [0] * 8
+                for r, row in enumerate(line.split('$')[:8]):
+                    for c, ch in enumerate(row):
+                        if ch == '*':
+                            rows[r] |= 1 << c
+                nodes.append(_level3(rows))
+                continue
+
+            k, nw, ne, sw, se = map(int, line.split())
+            zero = _current.store.zero(k - 1)
+            nw, ne, sw, se = (nodes[x] if x else zero for x in (nw, ne, sw, se))
+            # Macrocell rows grow downwards like i and its nw is the top left,
+            # which is the sw quadrant of get()
+            nodes.append(mknode(ne, se, nw, sw))
+
+        if len(nodes) == 1:
+            return _current.store.zero(3), generation, offset, rule
+        return nodes[-1], generation, offset, rule
+
+    @staticmethod
+    def _macrocell_rule(lines):
+        """Returns the rule of the #R line of a Macrocell file, which comes
+        before the first node, or Life"""
+        for line in lines:
+            line = line.strip()
+            if line.startswith('#R'):
+                return Rule.parse(line[2:].strip())
+            if line and line[0] not in '#[':
+                break
+        return LIFE
+
+    @_in_store
+    def save_macrocell(self, file):
+        """Writes the root and the generation to a text file object in
+        Macrocell format, streaming one line per distinct non-empty node of
+        level 3 or more. Smaller roots are padded to level 3. A root that
+        is not centered on the origin gets an #O i j line."""
+        root = self._root
+        while root.level < 3:
+            root = root.extend()
+        children = _current.store.children
+
+        file.write('[M2] (hashlife)\n#R %s\n' % _current.store.rule)
+        if self._generation:
+            file.write('#G %d\n' % self._generation)
+        if self._offset != (0, 0):
+            file.write('#O %d %d\n' % self._offset)
+
+        # empty nodes are written as 0, the others are numbered from 1
+        index = dict()
+        count = 0
+        for node in _walk([root], leaf = 3):
+            if node.level < 3 or node.population == 0:
+                index[id(node)] = 0
+                continue
+
+            if node.level == 3:
+                # Macrocell rows and columns grow with i and j
+                word = _current.store.word(node)
+                rows = []
+                for r in range(8):
+                    row = ''.join('*' if word >> (8 * c + 7 - r) & 1 else '.' for c in range(8))
+                    rows.append(row.rstrip('.'))
+                while rows and not rows[-1]:
+                    rows.pop()
+                file.write('$'.join(rows) + '$\n')
+            else:
+                nw, ne, sw, se = (index[id(q)] for q in children(node))
+                file.write('%d %d %d %d %d\n' % (node.level, sw, nw, se, ne))
+
+            count += 1
+            index[id(node)] = count
+
+    @_in_store
+    def checkpoint(self, path, memo = False):
+        """Writes the root, the generation, the offset, the rule and, with
+        memo, every memoized forward() result reachable from the root to a
+        binary file.
+
+        After a header and the generation, offset and Rule.code as
+        variable-size integers, the file holds the nodes as in pack(), a
+        record of four 32-bit integers per distinct node, level 3 nodes as
+        their word, followed by the memo entries as (node, l, result)
+        triples. Both sections are plain uint32 arrays that
+        restore() reads through a memory map."""
+        values = (self._generation,) + self._offset + (_current.store.rule.code,)
+        extra = b''.join(_encode(x) for x in values)
+        header = struct.calcsize(CHECKPOINT_HEADER)
+
+        with open(path, 'wb') as file:
+            file.write(bytes(header))
+            file.write(extra)
+            file.write(bytes(_aligned(len(extra)) - len(extra)))
+
+            index = dict()
+            memos = array.array('I')
+            count = 0
+            chunk = array.array('I')
+            for node, record, index in _records([self._root], memo = memo):
+                if record is None:
+                    continue
+                count += 1
+                chunk.extend(record)
+                # memoized results are walked, and numbered, before their node
+                if memo:
+                    for l, result in (node.cache or dict()).items():
+                        memos.extend((index[id(node)], l, index[id(result)]))
+                if len(chunk) >= 1 << 16:
+                    chunk.tofile(file)
+                    chunk = array.array('I')
+            chunk.tofile(file)
+
+            memos.tofile(file)
+
+            file.seek(0)
+            file.write(struct.pack(
+                CHECKPOINT_HEADER, CHECKPOINT_MAGIC, CHECKPOINT_VERSION,
+                index[id(self._root)], count, len(memos) // 3, len(extra)))
+
+    @staticmethod
+    def restore(path):
+        """Returns the universe saved in path by checkpoint() or by
+        save_macrocell(), with its generation, offset, rule and any saved
+        memo. The universe lives in store_for() its rule."""
+        with open(path, 'rb') as file:
+            magic = file.read(len(CHECKPOINT_MAGIC))
+        if magic != CHECKPOINT_MAGIC:
+            with open(path) as file:
+                rule = HashLifeUniverse._macrocell_rule(file)
+                file.seek(0)
+                with use_store(store_for(rule)):
+                    root, generation, origin, _ = HashLifeUniverse._read_macrocell(file)
+                    universe = HashLifeUniverse(root)
+            universe._generation = generation
+            universe._offset = origin
+            return universe
+
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+            _, version, root, count, memos, size = struct.unpack_from(CHECKPOINT_HEADER, data)
+            offset = struct.calcsize(CHECKPOINT_HEADER)
+            rule = LIFE
+            if version == 1:
+                generation, origin = int.from_bytes(data[offset:offset + size], 'little'), (0, 0)
+            elif version == 2:
+                generation, i, j = _decode(data[offset:offset + size], 3)
+                origin = (i, j)
+            else:
+                generation, i, j, code = _decode(data[offset:offset + size], 4)
+                origin, rule = (i, j), Rule.from_code(code)
+            offset += _aligned(size)
+
+            with use_store(store_for(rule)) as store:
+                nodes = [store.cell(0), store.cell(1)]
+                with memoryview(data)[offset:offset + 16 * count].cast('I') as words:
+                    # before version 4 every record holds four indices
+                    _rebuild(store, nodes, words)
+                offset += 16 * count
+                with memoryview(data)[offset:offset + 12 * memos].cast('I') as words:
+                    for i in range(0, 3 * memos, 3):
+                        node, l, result = words[i:i+3]
+                        store.memoize(nodes[node], l, nodes[result])
+                universe = HashLifeUniverse(nodes[root])
+
+        universe._generation = generation
+        universe._offset = origin
+        return universe
+
+    # the root is centered on self._offset, the methods below translate
+    # between the coordinates of the universe and those of the root
+
+    @_in_store
+    def get(self, i, j):
+        oi, oj = self._offset
+        return self.root.get(i - oi, j - oj)
+
+    def set_cell(self, i, j, alive = True):
+        """Sets the cell (i, j) alive or dead, in place"""
+        self.set_cells([(i, j)], alive)
+
+    @_in_store
+    def set_cells(self, cells, alive = True):
+        """Sets the cells (i, j) alive or dead, in place. The root grows to
+        hold them and only the nodes above them are rebuilt, once per batch:
+        the untouched subtrees and their memoized results are kept."""
+        oi, oj = self._offset
+        self._edit([(i - oi, j - oj, alive) for i, j in cells])
+
+    @_in_store
+    def paste_pattern(self, cells, i = 0, j = 0, mode = 'or'):
+        """Pastes a matrix of cells, rows of booleans or a 2d NumPy array as
+        in load(), with its first cell at (i, j). 'or' adds its live cells,
+        'copy' also kills the other cells of its rectangle."""
+        if mode not in ('or', 'copy'):
+            raise ValueError("unknown paste mode %r" % mode)
+        oi, oj = self._offset
+        i, j = i - oi, j - oj
+        if np is not None and isinstance(cells, np.ndarray):
+            cells = np.asarray(cells, dtype = bool)
+            if mode == 'or':
+                edits = [(i + a, j + b, True) for a, b in zip(*np.nonzero(cells))]
+            else:
+                edits = [
+                    (i + a, j + b, bool(cells[a, b]))
+                    for a in range(cells.shape[0]) for b in range(cells.shape[1])]
         else:
-            return node.nw.population
+            edits = [
+                (i + a, j + b, bool(x))
+                for a, row in enumerate(cells) for b, x in enumerate(row)
+                if x or mode == 'copy']
+        self._edit(edits)
+
+    def _edit(self, edits):
+        """Applies edits (i, j, alive), relative to the center of the root"""
+        if not edits:
+            return
+        root = self._root
+        while root.level < 3:
+            root = root.extend()
+        low = min(min(i, j) for i, j, _ in edits)
+        high = max(max(i, j) for i, j, _ in edits)
+        while not (-(1 << (root.level - 1)) <= low and high < 1 << (root.level - 1)):
+            root = root.extend()
+        self._root = _edit(root, edits)
+        if self._history is not None:
+            # the recorded states are not the past of the new pattern
+            self.watch(self._stop, self._limit)
+
+    @_in_store
+    def get_region(self, x0, y0, x1, y1, zoom = 0):
+        oi, oj = self._offset
+        size = 1 << zoom
+        if zoom and (x0 % size or y0 % size):
+            raise ValueError("x0 and y0 must be multiples of 2**zoom")
+        root = self.root
+        if zoom and (oi % size or oj % size):
+            # the pixels are not aligned with the nodes of the root
+            root, (oi, oj) = _align(root, oi, oj, zoom)
+        return root.get_region(x0 - oi, y0 - oj, x1 - oi, y1 - oj, zoom)
+
+    def live_cells(self):
+        oi, oj = self._offset
+        cells = self.root.live_cells()
+        while True:
+            # the store is only current while a batch is computed
+            with use_store(self._store):
+                batch = list(itertools.islice(cells, 1024))
+            if not batch:
+                return
+            for i, j in batch:
+                yield (i + oi, j + oj)
+
+    @_in_store
+    def bounding_box(self):
+        box = self.root.bounding_box()
+        if box is None:
+            return None
+        oi, oj = self._offset
+        x0, y0, x1, y1 = box
+        return (x0 + oi, y0 + oj, x1 + oi, y1 + oj)
+
+    @_in_store
+    def population_in(self, x0, y0, x1, y1):
+        oi, oj = self._offset
+        return self.root.population_in(x0 - oi, y0 - oj, x1 - oi, y1 - oj)
         
+    @_in_store
     def extend(self, k):
 
         while self._root.level < 2:
             self._root = self._root.extend()
             
+        # population outside of the four central grandchildren
         def helper(root):
             
-            pop = 0
-            pop += root.nw.nw.population
-            pop += root.nw.ne.population
-            pop += root.ne.nw.population
-            pop += root.ne.ne.population
-            
-            pop += root.se.se.population
-            pop += root.se.sw.population
-            pop += root.sw.sw.population
-            pop += root.sw.se.population
-            
-            pop += root.nw.sw.population
-            pop += root.sw.nw.population
-            pop += root.ne.se.population
-            pop += root.se.ne.population
+            pop = root.population
+            pop -= root.nw.se.population
+            pop -= root.ne.sw.population
+            pop -= root.sw.ne.population
+            pop -= root.se.nw.population
             
             return pop
         
-        pop = helper(self._root)
+        # once extended, the border of the root is made of empty nodes only
+        if helper(self._root):
+            self._root = self._root.extend()
         
-        while pop or self._root.level < k:
+        while self._root.level < k:
             self._root = self._root.extend()
-
-            pop = helper(self._root)
         
+    @_in_store
     def rounds(self, n):
-        
-        if n <= 0:
-            return
+        """Compute (in place) the n-th next generation of the universe, in
+        the steps given by plan(n)"""
+        for l in self.plan(n):
+            found = self._advance(l)
+            self._store.maybe_collect()
+            if found and self._stop:
+                break
 
-        extendtimes = math.ceil(math.log2(n)) + 2
-        self.extend(extendtimes)
-        
-        while n > 0:
-            if n == 1:
-                self._root = self._root.forward(l = 0)
-                self._generation += 1
-                n -= 1
-                return
+    def _advance(self, l, results = None, check = None):
+        """Takes one step of 2**l generations, returns whether watch() found
+        a cycle. results, a dict shared by several universes, maps id(root)
+        to (root, next root) so that equal roots are forwarded once. check
+        is passed to forward_iterative(), which then takes the step."""
+        self._prepare(l)
+        if check is not None:
+            self._root = self._forward(l, check)
+        elif results is None:
+            self._root = self._forward(l)
+        else:
+            root = self._root
+            if id(root) not in results:
+                results[id(root)] = (root, self._forward(l))
+            self._root = results[id(root)][1]
+        self._generation += 1 << l
+        self._used[l] = self._used.get(l, 0) + 1
+        self._trim()
+        return self._history is not None and self._cycle is None and self._record()
+
+    def start(self, n, executor = None, budget = None, callback = None):
+        """Starts computing the n-th next generation in the background and
+        returns its Stepping, see there. The universe keeps its state until
+        the stepping stops, at its target, cancelled or out of its budget
+        of seconds, and then takes the state of the last step completed."""
+        return Stepping(self, n, executor, budget, callback)
+
+    def copy(self):
+        """Returns a universe in the same state sharing all its nodes"""
+        with use_store(self._store):
+            other = HashLifeUniverse(self._root)
+        other._generation = self._generation
+        other._offset = self._offset
+        other._mode, other._step = self._mode, self._step
+        other._used = dict(self._used)
+        return other
+
+    def run_until(self, generation):
+        """Computes (in place) the given generation of the universe"""
+        if generation < self._generation:
+            raise ValueError("generation %d is in the past" % generation)
+        self.rounds(generation - self._generation)
+
+    def set_schedule(self, mode = 'jump', step = None):
+        """Chooses how rounds() splits its generations into steps of 2**l.
+
+        'jump' takes the largest steps first, the binary decomposition of
+        n. 'fixed' repeats steps of 2**step and finishes with jumps; step
+        defaults to the step this universe used most so far, so repeated
+        queries with varying n keep hitting the memo of that step size."""
+        if mode not in ('jump', 'fixed'):
+            raise ValueError("unknown schedule %r" % mode)
+        self._mode = mode
+        self._step = step
+
+    def plan(self, n):
+        """Returns the exponents l of the steps 2**l rounds(n) will take"""
+        step = None
+        if self._mode == 'fixed':
+            step = self._step
+            if step is None and self._used:
+                step = max(self._used, key = lambda l: (self._used[l], l))
+        return _steps(n, step)
+
+    def _trim(self):
+        """Shrinks the root to the smallest node, down to level 3, that
+        still holds the whole pattern, picking among the nine sub-squares
+        made of 2x2 grandchildren and moving the offset accordingly"""
+        root = self._root
+        oi, oj = self._offset
+        while root.level > 3:
+            h = 1 << (root.level - 2)
+            # grandchildren by position, g[a][b] with a along i and b along j
+            g = [[None] * 4 for _ in range(4)]
+            for a, b, q in ((0, 0, root.sw), (0, 2, root.nw), (2, 0, root.se), (2, 2, root.ne)):
+                g[a][b], g[a][b+1], g[a+1][b], g[a+1][b+1] = q.sw, q.nw, q.se, q.ne
+
+            # the center first, so that a centered pattern stays put
+            for a, b in ((1, 1), (0, 1), (2, 1), (1, 0), (1, 2), (0, 0), (0, 2), (2, 0), (2, 2)):
+                pop = \
+                    g[a][b+1].population + g[a+1][b+1].population + \
+                    g[a][b].population + g[a+1][b].population
+                if pop == root.population:
+                    root = _current.store.node(g[a][b+1], g[a+1][b+1], g[a][b], g[a+1][b])
+                    oi += (a - 1) * h
+                    oj += (b - 1) * h
+                    break
             else:
-                l = 1
-                
-                while n > 2**l:
-                    l += 1
-                    
-                if 2**l > n:
-                    l -= 1
-                self._root = self._root.forward(l = l)
-                self._generation += 2**l
-                n -= 2**l
-                
-                if n != 0:
-                    self.extend(self.root.level + 1)
+                break
+        self._root = root
+        self._offset = (oi, oj)
+
+    @_in_store
+    def watch(self, stop = True, limit = 1 << 12):
+        """Records the state of the universe after every step of rounds(),
+        up to a translation, until the pattern repeats; cycle then holds
+        the Cycle found. With stop, rounds() returns as soon as it is found,
+        leaving the universe at the generation it was found. Only the last
+        limit states are kept.
+
+        A state is the canonical node holding the pattern with its
+        bounding box at the corner: equal patterns anywhere are the same
+        node, so recording and looking up a state is a dict operation.
+
+            universe.watch()
+            universe.rounds(1 << 20)
+            if universe.cycle is not None:
+                print(universe.cycle.kind, universe.cycle.period)
+        """
+        self._history = OrderedDict()
+        self._cycle = None
+        self._stop = stop
+        self._limit = limit
+        self._record()
+
+    @_in_store
+    def unwatch(self):
+        """Stops recording states and forgets them"""
+        self._history = None
+
+    @property
+    def cycle(self):
+        """The Cycle found since watch(), or None"""
+        return self._cycle
+
+    @_in_store
+    def find_cycle(self, generations, step = 1):
+        """Runs at most generations more generations in steps of step, as
+        long as the pattern does not repeat, and returns the Cycle found or
+        None. The start of the cycle is at most step generations late."""
+        watching = self._history is not None
+        if not watching:
+            self.watch()
+        end = self._generation + generations
+        while self._cycle is None and self._generation < end:
+            self.rounds(min(step, end - self._generation))
+        if not watching:
+            self.unwatch()
+        return self._cycle
+
+    def roots(self):
+        """Returns the nodes the universe keeps alive: its root and the
+        states recorded by watch()"""
+        if self._history:
+            return [self._root] + list(self._history)
+        return [self._root]
+
+    def _signature(self):
+        """Returns the canonical node of the pattern, its bounding box
+        moved to the corner of the smallest fitting node of level 3 or
+        more, and the position of that corner in the universe"""
+        root = self._root
+        box = root.bounding_box()
+        if box is None:
+            return _current.store.zero(3), (0, 0)
+        x0, y0, x1, y1 = box
+        k = max(3, (max(x1 - x0, y1 - y0) - 1).bit_length())
+        while root.level <= k + 1:
+            root = root.extend()
+        half = 1 << (root.level - 1)
+        oi, oj = self._offset
+        return _window(root, x0 + half, y0 + half, k), (x0 + oi, y0 + oj)
+
+    def _record(self):
+        """Records the current state, returns whether it was seen before"""
+        node, position = self._signature()
+        seen = self._history.get(node)
+        if seen is None:
+            self._history[node] = (self._generation, position)
+            if len(self._history) > self._limit:
+                self._history.popitem(last = False)
+            return False
+
+        start, first = seen
+        period = self._generation - start
+        shift = (position[0] - first[0], position[1] - first[1])
+        # the state repeats every period generations, and so every divisor
+        # of it that brings node back to itself
+        for p in _factors(period):
+            probe = HashLifeUniverse(node)
+            _, origin = probe._signature()
+            probe.rounds(period // p)
+            other, where = probe._signature()
+            if other is node:
+                period //= p
+                shift = (where[0] - origin[0], where[1] - origin[1])
+        self._cycle = Cycle(start, period, shift)
+        return True
+
+    def _prepare(self, l):
+        """Extends the root until a step of 2**l generations can be computed
+        from it: its level is at least l + 3 and the pattern fits in its
+        central quarter. A pattern may grow one cell a generation, as a
+        long line does in Life, and the result, the center of the root,
+        reaches 2**(level-3) >= 2**l cells beyond the central quarter, so
+        it keeps every cell."""
+        root = self._root
+        while root.level < max(l + 3, 3) or root.population != _center(_center(root)).population:
+            root = root.extend()
+        self._root = root
 
     def round(self):
         return self.rounds(1)
 
+    def set_executor(self, executor, depth = 1):
+        """Farms the top depth levels of every step of rounds() out to
+        executor, typically a concurrent.futures.ProcessPoolExecutor owned
+        by the caller. None goes back to computing in this process."""
+        self._executor = executor
+        self._depth = depth
+
+    def _forward(self, l, check = None):
+        if self._executor is not None and self._root.level - self._depth >= PARALLEL_MIN_LEVEL:
+            return forward_parallel(self._root, l, self._executor, self._depth)
+        return _step(self._root, l, check)
+
     @property
     def root(self):
         return self._root
@@ -591,19 +3224,442 @@ class HashLifeUniverse(Universe):
     @property
     def generation(self):
         return self._generation
+
+    @property
+    def population(self):
+        return self.root.population
+
+    @property
+    def offset(self):
+        return self._offset
+
+    @property
+    def store(self):
+        return self._store
+
+    @property
+    def rule(self):
+        return self._store.rule
     
+    @_in_store
     def __str__(self):
-        s = ''
-        k = self.root.level - 1
-        for i in range(-2**k, 2**k):
-            for j in range(-2**k, 2**k):
-                if self.get(i,j) == 1:
-                    s += '* '
-                if self.get(i,j) == 0:
-                    s += '. '
-            s += '\n'
-        
-        return s
+        return str(self.root)
+
+class Cancelled(Exception):
+    """Raised inside a Stepping to stop it, cancelled or out of time"""
+
+Progress = namedtuple('Progress', 'generation target created seconds')
+
+class Stepping:
+    """rounds() running in a background thread, made by
+    HashLifeUniverse.start(). It works on a copy of the universe and
+    publishes the root, generation and offset after every step at once, so
+    that snapshot() is always consistent; the universe itself takes the
+    final state when the stepping stops.
+
+    cancel() and the budget are checked between steps and inside them,
+    before every node the computation descends into, so even a single
+    step of 2**60 generations stops quickly. What it memoized so far stays
+    in the store and makes a new start cheaper.
+
+    The thread is started on executor, a thread pool, or on a thread of its
+    own. The store of the universe is only current in that thread, so
+    other universes, of the same store or not, can be used meanwhile; the
+    store is not collected while another thread works in it, so it may
+    grow until both are idle. Stepping is awaitable, for asyncio callers:
+
+        stepping = universe.start(1 << 60, budget = 30)
+        async for progress in stepping.aupdates():
+            print(progress.generation, progress.created)
+        await stepping
+    """
+
+    def __init__(self, universe, n, executor = None, budget = None, callback = None):
+        self._universe = universe
+        self._work = universe.copy()
+        self._state = (self._work.root, self._work.generation, self._work.offset)
+        self.target = universe.generation + n
+        self._steps = universe.plan(n)
+        self._callback = callback
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._start = time.monotonic()
+        self._deadline = None if budget is None else self._start + budget
+        self._created = universe.store.created
+        self.status = 'running'
+
+        if executor is None:
+            self.future = concurrent.futures.Future()
+            threading.Thread(target = self._thread, daemon = True).start()
+        else:
+            self.future = executor.submit(self._run)
+
+    def _thread(self):
+        if not self.future.set_running_or_notify_cancel():
+            return
+        try:
+            self.future.set_result(self._run())
+        except BaseException as error:
+            self.future.set_exception(error)
+
+    def _check(self):
+        if self._cancel.is_set():
+            raise Cancelled('cancelled')
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            raise Cancelled('timeout')
+
+    def _run(self):
+        work = self._work
+        try:
+            with use_store(work.store):
+                for l in self._steps:
+                    self._check()
+                    work._advance(l, check = self._check)
+                    self._state = (work.root, work.generation, work.offset)
+                    work.store.maybe_collect()
+                    if self._callback is not None:
+                        self._callback(self.progress())
+            self.status = 'done'
+        except Cancelled as stop:
+            self.status = str(stop)
+        except BaseException:
+            self.status = 'failed'
+            raise
+        finally:
+            universe = self._universe
+            root, generation, offset = self._state
+            used = work._used
+            universe._root, universe._generation, universe._offset = root, generation, offset
+            universe._used = used
+            self._done.set()
+        return universe
+
+    def cancel(self):
+        """Asks the stepping to stop, the universe keeps the last step
+        completed"""
+        self._cancel.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout = None):
+        """Waits for the stepping to stop and returns the universe"""
+        return self.future.result(timeout)
+
+    def snapshot(self):
+        """Returns a universe in the state of the last step completed"""
+        root, generation, offset = self._state
+        with use_store(self._work.store):
+            universe = HashLifeUniverse(root)
+        universe._generation = generation
+        universe._offset = offset
+        return universe
+
+    def progress(self):
+        """Returns the generation reached, the target, the number of nodes
+        created since the start in the store and the seconds elapsed"""
+        return Progress(
+            self._state[1], self.target,
+            self._work.store.created - self._created,
+            time.monotonic() - self._start)
+
+    def updates(self, interval = 0.1):
+        """Yields the progress every interval seconds until the stepping
+        stops, and once more at the end"""
+        while not self._done.wait(interval):
+            yield self.progress()
+        yield self.progress()
+
+    async def aupdates(self, interval = 0.1):
+        """Same as updates(), sleeping in the event loop"""
+        import asyncio
+        while not self._done.is_set():
+            yield self.progress()
+            await asyncio.sleep(interval)
+        yield self.progress()
+
+    def __await__(self):
+        import asyncio
+        return asyncio.wrap_future(self.future).__await__()
+
+class Batch:
+    """Many universes advanced together in one store, for censuses of
+    small patterns. The universes share every subtree and memoized result,
+    each step is taken by all of them before the next one, roots that are
+    equal (the same pattern, up to a translation of the tree) are forwarded
+    once per step, and the store is collected once per step.
+
+    patterns are HashLifeUniverse objects, advanced in place, root nodes or
+    matrices of cells as in HashLifeUniverse.load(). With watch, every
+    universe stops as soon as its pattern repeats and its cycle is kept.
+
+        batch = Batch(soups, rule = 'B3/S23', watch = True)
+        batch.rounds(1 << 12)
+        print(batch.summary())
+    """
+
+    def __init__(self, patterns, rule = None, watch = False):
+        self.store = _current.store if rule is None else store_for(rule)
+        self.universes = []
+        with use_store(self.store):
+            for pattern in patterns:
+                if isinstance(pattern, HashLifeUniverse):
+                    if pattern.store is not self.store:
+                        raise ValueError("the universe lives in another store")
+                    universe = pattern
+                elif isinstance(pattern, AbstractNode):
+                    universe = HashLifeUniverse(pattern)
+                else:
+                    n = len(pattern)
+                    universe = HashLifeUniverse(n, len(pattern[0]) if n else 0, pattern)
+                if watch:
+                    universe.watch()
+                self.universes.append(universe)
+        # number of roots forwarded at the last step, after deduplication
+        self.distinct = len(set(id(u.root) for u in self.universes))
+
+    def rounds(self, n, step = None):
+        """Advances every universe (still running, with watch) n
+        generations, in steps of 2**step and then in the steps of the binary
+        decomposition of what is left. Without step, the largest steps come
+        first; with watch, small steps find cycles sooner."""
+        active = [u for u in self.universes if u.cycle is None]
+        with use_store(self.store):
+            for l in _steps(n, step):
+                if not active:
+                    break
+                results = dict()
+                active = [u for u in active if not u._advance(l, results)]
+                self.distinct = len(results)
+                self.store.maybe_collect()
+
+    @property
+    def populations(self):
+        return [u.population for u in self.universes]
+
+    @property
+    def cycles(self):
+        """The Cycle of every universe, None for those without one"""
+        return [u.cycle for u in self.universes]
+
+    def summary(self):
+        """Returns statistics on the populations and, with watch, counts
+        of the kinds of cycles found"""
+        populations = self.populations
+        count = len(populations)
+        total = sum(populations)
+        stats = {
+            'universes': count,
+            'distinct_roots': self.distinct,
+            'population': total,
+            'min_population': min(populations) if count else 0,
+            'max_population': max(populations) if count else 0,
+            'mean_population': total / count if count else 0.,
+            'nodes': self.store.node_count,
+        }
+        kinds = Counter(c.kind for c in self.cycles if c is not None)
+        if kinds:
+            stats['kinds'] = dict(kinds)
+        return stats
+
+def _shade(population, area):
+    """Grey level of a pixel covering area cells: black when empty, and
+    never darker than 64 otherwise, so that sparse regions stay visible"""
+    return 64 + 191 * population // area if population else 0
+
+def _png(rows):
+    """Encodes rows of grey levels, given as bytes, as a PNG image"""
+    def chunk(kind, data):
+        return \
+            struct.pack('>I', len(data)) + kind + data + \
+            struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF)
+    header = struct.pack('>IIBBBBB', len(rows[0]), len(rows), 8, 0, 0, 0, 0)
+    # each scanline starts with its filter type, 0 for none
+    data = zlib.compress(b''.join(b'\0' + row for row in rows))
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', data) + chunk(b'IEND', b'')
+
+class Tiles:
+    """Slippy-map pyramid of square greyscale tiles of a universe, read
+    from the populations of its nodes.
+
+    The pyramid covers a square of 2**level cells centered on (0, 0), its
+    world, and at zoom z the world is cut into 2**z x 2**z tiles, the tile
+    (z, x, y) being column x and row y, rows going down with i and columns
+    right with j as in __str__. A tile is the node covering it and each of
+    its pixels the density of the descendant at the matching level, so a
+    tile costs the same at any zoom. The deepest zoom, max_zoom, has a
+    pixel per cell.
+
+    Renderings are cached by node, least recently used first up to
+    max_bytes, so that the repeated regions of a pattern render once, and
+    the cache stays valid as the universe runs. A tile keeps its cells as
+    the universe runs, until the pattern leaves the world: the world then
+    doubles, and so do the tiles of every zoom. level sets the smallest
+    world, so that a growing pattern keeps its tiles; bounds() tells
+    where a tile is.
+
+        tiles = Tiles(universe)
+        tiles.save('tiles', zooms = range(8))   # tiles/z/x/y.png
+    """
+
+    def __init__(self, universe, size = 256, level = None, max_bytes = 64 << 20):
+        if size < 1 or size & (size - 1):
+            raise ValueError("the size of the tiles must be a power of 2")
+        self.universe = universe
+        self.size = size
+        self.level = level
+        self.max_bytes = max_bytes
+        self._t = size.bit_length() - 1
+        # the world only grows, and is rebuilt when the root changes
+        self._level = max(self._t, level or 0, 3)
+        self._world = None
+        # {(id(node), t): (node, rows)} and {(id(node), None): (node, png)}
+        self._cache = OrderedDict()
+        self._bytes = 0
+
+    def world(self):
+        """Returns the node the pyramid covers, the square of the universe
+        centered on (0, 0) holding its root, and the coordinates of its
+        first cell"""
+        universe = self.universe
+        root, (oi, oj) = universe.root, universe.offset
+        if self._world is not None and self._world[0] is root and self._world[1] == (oi, oj):
+            node = self._world[2]
+            half = 1 << (node.level - 1)
+            return node, -half, -half
+
+        # the world holds [oi - h, oi + h) x [oj - h, oj + h), and root
+        # extended to m levels holds the world, m above its level
+        h = 1 << (root.level - 1)
+        while 1 << (self._level - 1) < max(abs(oi), abs(oj)) + h:
+            self._level += 1
+        level = self._level
+        half = 1 << (level - 1)
+        with use_store(universe.store):
+            node = root
+            while node.level <= level or 1 << (node.level - 1) < half + max(abs(oi), abs(oj)):
+                node = node.extend()
+            corner = 1 << (node.level - 1)
+            node = _window(node, corner - half - oi, corner - half - oj, level)
+        # the entry holds root, so its id stays its own
+        self._world = (root, (oi, oj), node)
+        return node, -half, -half
+
+    @property
+    def max_zoom(self):
+        return self.world()[0].level - self._t
+
+    def bounds(self, z, x, y):
+        """Returns the cells (x0, y0, x1, y1) of [x0, x1) x [y0, y1) that
+        the tile (z, x, y) covers, in the coordinates of get()"""
+        node, i, j = self.world()
+        span = 1 << (node.level - z)
+        return (i + y * span, j + x * span, i + (y + 1) * span, j + (x + 1) * span)
+
+    def node(self, z, x, y):
+        """Returns the node of the tile (z, x, y)"""
+        node = self.world()[0]
+        if not 0 <= z <= node.level - self._t:
+            raise ValueError("zoom %d is not in [0, %d]" % (z, node.level - self._t))
+        if not (0 <= x < 1 << z and 0 <= y < 1 << z):
+            raise ValueError("tile (%d, %d) is not in the zoom %d" % (x, y, z))
+        with use_store(self.universe.store):
+            children = _current.store.children
+            for shift in range(z - 1, -1, -1):
+                # the quadrants are nw (top right), ne, sw (top left), se
+                nw, ne, sw, se = children(node)
+                if y >> shift & 1:
+                    node = ne if x >> shift & 1 else se
+                else:
+                    node = nw if x >> shift & 1 else sw
+        return node
+
+    def pixels(self, z, x, y):
+        """Returns the grey levels of the tile (z, x, y) as a list of rows
+        of bytes"""
+        node = self.node(z, x, y)
+        with use_store(self.universe.store):
+            return self._render(node, self._t)
+
+    def png(self, z, x, y):
+        """Returns the tile (z, x, y) as a PNG image"""
+        node = self.node(z, x, y)
+        entry = self._cache.get((id(node), None))
+        if entry is None:
+            with use_store(self.universe.store):
+                image = _png(self._render(node, self._t))
+            self._keep((id(node), None), node, image, len(image))
+            return image
+        self._cache.move_to_end((id(node), None))
+        return entry[1]
+
+    def save(self, directory, zooms = None):
+        """Writes the tiles of zooms, every zoom by default, to
+        directory/z/x/y.png and returns their number. Empty tiles are not
+        written, and neither is anything below them, so that a sparse
+        pattern of any size is quick to save; map viewers show missing
+        tiles as blank."""
+        world = self.world()[0]
+        zooms = range(self.max_zoom + 1) if zooms is None else zooms
+        count = 0
+        for z in zooms:
+            for x, y in self._nonempty(world, z):
+                path = os.path.join(directory, str(z), str(x))
+                os.makedirs(path, exist_ok = True)
+                with open(os.path.join(path, '%d.png' % y), 'wb') as file:
+                    file.write(self.png(z, x, y))
+                count += 1
+        return count
+
+    def _nonempty(self, world, z):
+        """Yields the (x, y) of the tiles of zoom z holding live cells"""
+        with use_store(self.universe.store):
+            children = _current.store.children
+            stack = [(world, 0, 0, z)]
+            while stack:
+                node, x, y, depth = stack.pop()
+                if node.population == 0:
+                    continue
+                if depth == 0:
+                    yield x, y
+                    continue
+                nw, ne, sw, se = children(node)
+                x, y = 2 * x, 2 * y
+                stack.extend(((se, x, y + 1, depth - 1), (ne, x + 1, y + 1, depth - 1),
+                              (sw, x, y, depth - 1), (nw, x + 1, y, depth - 1)))
+
+    def _keep(self, key, node, value, nbytes):
+        # the entry holds node, so its id stays its own
+        self._cache[key] = (node, value)
+        self._bytes += nbytes
+        while self._bytes > self.max_bytes and len(self._cache) > 1:
+            (_, t), (_, old) = self._cache.popitem(last = False)
+            self._bytes -= len(old) if t is None else len(old) * len(old)
+
+    def _render(self, node, t):
+        """Returns the 2**t rows of 2**t grey levels of node, each the
+        density of a descendant 2**t times smaller"""
+        side = 1 << t
+        if node.population == 0:
+            return [bytes(side)] * side
+        if t == 0:
+            return [bytes((_shade(node.population, 1 << 2 * node.level),))]
+        key = (id(node), t)
+        entry = self._cache.get(key)
+        if entry is not None:
+            self._cache.move_to_end(key)
+            return entry[1]
+
+        if node.level == 3 and t == 3:
+            # the rows r of a lane are its bits 7 - r
+            word = _current.store.word(node)
+            lanes = [word >> 8 * c & 0xFF for c in range(8)]
+            rows = [bytes(255 if lane >> 7 - r & 1 else 0 for lane in lanes) for r in range(8)]
+        else:
+            nw, ne, sw, se = (self._render(child, t - 1) for child in _current.store.children(node))
+            rows = [a + b for a, b in zip(sw, nw)] + [a + b for a, b in zip(se, ne)]
+        self._keep(key, node, rows, side * side)
+        return rows
     
 '''
             